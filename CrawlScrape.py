@@ -6,7 +6,7 @@ import errno
 import os.path
 import json
 import logging
-from urllib.parse import urlparse, urljoin
+from urllib.parse import urlparse, urljoin, urlsplit, urlunsplit, unquote_plus
 import tldextract
 import requests
 from bs4 import BeautifulSoup, Comment
@@ -18,19 +18,253 @@ import string
 import sys
 import traceback
 import socket
+import ssl
+import random
+import threading
+import mmap
+import struct
+import hashlib
+import math
+import contextlib
+import cProfile
+import pstats
+import tracemalloc
+import gzip
+import uuid
+import http.client
+import queue
+import copy
+import atexit
+import logging.handlers
+import re
+import fnmatch
+import collections
+import email.utils
 from tld import get_tld
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 sys.setrecursionlimit(10000)
 
 FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
-logging.basicConfig(format=FORMAT,
-                    datefmt='%d/%m/%Y %H:%M:%S',
-                    level=logging.DEBUG, )
+DATE_FORMAT = '%d/%m/%Y %H:%M:%S'
+
+logger = logging.getLogger('CrawlScrape')
+logger.addHandler(logging.NullHandler())
+log_listener = None
+log_config = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats log records as single-line JSON objects, with the site, url and stage fields of crawling records
+    """
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, DATE_FORMAT),
+            'level': record.levelname,
+            'message': record.getMessage(),
+            'site': getattr(record, 'site', None),
+            'url': getattr(record, 'url', None),
+            'stage': getattr(record, 'stage', None),
+        }
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed'] = record.suppressed
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Formats log records as text lines, noting how many similar records the rate limit suppressed before a record
+    """
+    def format(self, record):
+        if getattr(record, 'suppressed', 0):
+            record = copy.copy(record)
+            record.msg = record.getMessage() + " (" + str(record.suppressed) + " similar records suppressed)"
+            record.args = None
+        return super().format(record)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `rate` records of the same message template and level per period, the first record after
+    a period reports how many similar records were suppressed; records outside the given levels are never limited
+    """
+    def __init__(self, rate=20, period=60, min_level=logging.WARNING, max_level=logging.WARNING):
+        """
+        :param rate: the number of records of the same template let through per period
+        :type rate: int
+        :param period: the length of the period in seconds
+        :type period: float
+        :param min_level: the lowest level that is rate limited
+        :type min_level: int
+        :param max_level: the highest level that is rate limited
+        :type max_level: int
+        """
+        super().__init__()
+        self.rate = rate
+        self.period = period
+        self.min_level = min_level
+        self.max_level = max_level
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if not self.min_level <= record.levelno <= self.max_level:
+            return True
+        key = (record.levelno, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            window_start, count, suppressed = self.windows.get(key, (now, 0, 0))
+            if now - window_start >= self.period:
+                if suppressed:
+                    record.suppressed = suppressed
+                window_start, count, suppressed = now, 0, 0
+            if count < self.rate:
+                self.windows[key] = (window_start, count + 1, suppressed)
+                return True
+            self.windows[key] = (window_start, count, suppressed + 1)
+            return False
+
+
+class CrawlQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that only merges the message arguments and the traceback in the logging thread, the formatting
+    itself is left to the handlers of the background listener
+    """
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class CrawlLoggerAdapter(logging.LoggerAdapter):
+    """
+    Logger adapter adding the site of a WebCrawling object to its records, merged with the extra fields of each call
+    """
+    def process(self, msg, kwargs):
+        kwargs['extra'] = dict(self.extra, **kwargs.get('extra', {}))
+        return msg, kwargs
+
 
-logger = logging.getLogger()
-handler = logging.FileHandler('logfile.log')
-handler.setFormatter(logging.Formatter(FORMAT))
-logger.addHandler(handler)
+def configure_logging(level=logging.INFO, log_file='logfile.log', console=True, structured=False, rate_limit=20,
+                      rate_period=60, rate_limit_min_level=logging.WARNING, rate_limit_max_level=logging.WARNING):
+    """
+    this function configures the logging of the library, the records are put on a queue and written by a
+    background thread, so the crawling threads never wait on the file or console handlers; the records of worker
+    processes reach the same handlers through start_worker_logging
+    :param level: the lowest level logged
+    :param log_file: the file the records are written to, None for no file
+    :param console: whether the records are also written to the standard error
+    :param structured: whether the records are written as JSON objects with site, url and stage fields
+    :param rate_limit: the number of records of the same message per rate_period, None for no limit
+    :param rate_period: the length of the rate limit period in seconds
+    :param rate_limit_min_level: the lowest level that is rate limited, by default only warnings are limited
+    :param rate_limit_max_level: the highest level that is rate limited
+    :return: the QueueListener writing the records
+    """
+    global log_listener, log_config
+    stop_logging()
+    formatter = JsonFormatter() if structured else TextFormatter(FORMAT, DATE_FORMAT)
+    handlers = []
+    if log_file:
+        handlers.append(logging.FileHandler(log_file))
+    if console:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    log_config = {
+        'queue': queue.SimpleQueue(),
+        'level': level,
+        'rate_limit': rate_limit,
+        'rate_period': rate_period,
+        'rate_limit_min_level': rate_limit_min_level,
+        'rate_limit_max_level': rate_limit_max_level
+    }
+    add_queue_handler(log_config)
+    log_listener = logging.handlers.QueueListener(log_config['queue'], *handlers, respect_handler_level=True)
+    log_listener.start()
+    return log_listener
+
+
+def add_queue_handler(config):
+    """
+    this function sends the records of the library to the queue of the given logging configuration
+    :param config: the logging configuration built by configure_logging
+    :return: None
+    """
+    queue_handler = CrawlQueueHandler(config['queue'])
+    if config['rate_limit']:
+        queue_handler.addFilter(RateLimitFilter(config['rate_limit'], config['rate_period'],
+                                                config['rate_limit_min_level'], config['rate_limit_max_level']))
+    logger.addHandler(queue_handler)
+    logger.setLevel(config['level'])
+    logger.propagate = False
+
+
+def start_worker_logging():
+    """
+    this function forwards the records of the worker processes of a run to the handlers of configure_logging, through
+    a process-shared queue created only for the process pool, as it is slower than the queue of the crawling threads
+    :return: the logging configuration of the workers passed to init_worker_logging and the QueueListener of their
+    records, to be stopped once the pool is joined; None, None if logging is not configured
+    """
+    if log_config is None or log_listener is None:
+        return None, None
+    worker_config = dict(log_config, queue=multiprocessing.Queue())
+    worker_listener = logging.handlers.QueueListener(worker_config['queue'], *log_listener.handlers,
+                                                     respect_handler_level=True)
+    worker_listener.start()
+    return worker_config, worker_listener
+
+
+def init_worker_logging(config):
+    """
+    this function is the initializer of the worker processes of a run, it sends their records to the queue of the
+    listener of the parent process instead of a copy of the parent handlers, or of no handler at all
+    :param config: the logging configuration of the workers from start_worker_logging, None if logging is not
+    configured
+    :return: None
+    """
+    global log_listener, log_config
+    for handler in list(logger.handlers):
+        if isinstance(handler, CrawlQueueHandler):
+            logger.removeHandler(handler)
+    log_listener = None
+    log_config = config
+    if config is not None:
+        add_queue_handler(config)
+
+
+def stop_logging():
+    """
+    this function flushes the queued records and removes the logging configured by configure_logging
+    :return: None
+    """
+    global log_listener, log_config
+    for handler in list(logger.handlers):
+        if isinstance(handler, CrawlQueueHandler):
+            logger.removeHandler(handler)
+    log_config = None
+    if log_listener is not None:
+        log_listener.stop()
+        for handler in log_listener.handlers:
+            handler.close()
+        log_listener = None
+
+
+atexit.register(stop_logging)
 
 
 def get_url_tld(url):
@@ -40,9 +274,8 @@ def get_url_tld(url):
     """
     try:
         return get_tld(url)
-    except Exception as err:
-        traceback.print_tb(err.__traceback__)
-        logger.error(traceback.format_exc())
+    except Exception:
+        logger.error("Unable to get the top-level domain of %s", url, exc_info=True, extra={'url': url})
         return None
 
 
@@ -86,9 +319,8 @@ def get_geo_loc(url):
         req = requests.get(url_geolocation, timeout=15)
         returned_result = req.json()['country_name']
         return returned_result
-    except Exception as err:
-        traceback.print_tb(err.__traceback__)
-        # logger.error(traceback.format_exc())
+    except Exception:
+        logger.debug("Unable to get the geographical location of %s", url, exc_info=True, extra={'url': url})
         return None
 
 
@@ -104,12 +336,1100 @@ def is_valid(url):
         return bool(parsed.netloc) and bool(parsed.scheme)
 
 
+SKIPPED_EXTENSIONS = ['JPEG', 'GIF', 'PNG', 'EPS', 'AI', 'PDF', 'JPG', 'TIFF', 'PSD', 'INDD', 'RAW', 'DOC', 'DOCM',
+                      'DOCX', 'DOT', 'DOTM', 'DOTX', 'RTF', 'TXT', 'WPS', 'XPS', 'CSV', 'DBF', 'DIF', 'ODS', 'PRN',
+                      'SLK', 'XLA', 'XLAM', 'XLS', 'XLW', 'MP4', 'MP3', 'ODP', 'POT', 'POTM', 'POTX', 'PPA', 'PPS',
+                      'PPTM', 'PPTX', 'PPSX', 'WMF', 'XML', 'MSI', 'EXE', 'JAR', 'ZIP', 'DEB', 'TAR.GZ']
+
+STRIPPED_QUERY_PARAMS = ['utm_*', 'fbclid', 'gclid', 'dclid', 'msclkid', 'mc_cid', 'mc_eid', '_ga', 'phpsessid',
+                         'jsessionid', 'sessionid']
+
+INDEX_PAGES = ['index.html', 'index.htm', 'index.php', 'default.asp', 'default.aspx']
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def compile_wildcards(patterns):
+    """
+    :param patterns: list of case-insensitive shell-style wildcard patterns, such as 'utm_*'
+    :return: a single compiled regular expression matching any of the patterns, None if there are no patterns
+    """
+    if not patterns:
+        return None
+    return re.compile('|'.join(fnmatch.translate(pattern) for pattern in patterns), re.IGNORECASE)
+
+
+def remove_dot_segments(path):
+    """
+    :param path: the path of a URL
+    :return: the path with its '.' and '..' segments resolved (RFC 3986, section 5.2.4)
+    """
+    if '.' not in path:
+        return path
+    segments = []
+    for segment in path.split('/'):
+        if segment == '..':
+            if len(segments) > 1:
+                segments.pop()
+        elif segment != '.':
+            segments.append(segment)
+    if path.endswith(('/.', '/..')):
+        segments.append('')
+    return '/'.join(segments)
+
+
+class UrlCanonicalizer:
+    """
+    This class canonicalizes and filters the found URLs before they are queued, so equivalent URLs take a single
+    fetch slot and documents/images never take one
+    """
+    def __init__(self, keep_query_params=None, strip_query_params=None, skip_extensions=None, skip_patterns=None,
+                 remove_index_pages=True, trailing_slash='keep'):
+        """
+        :param keep_query_params: the wildcard patterns of the query parameters kept, None to keep every parameter
+        that is not stripped, an empty list to drop the whole query
+        :type keep_query_params: list
+        :param strip_query_params: the wildcard patterns of the query parameters dropped, by default
+        STRIPPED_QUERY_PARAMS (tracking and session parameters)
+        :type strip_query_params: list
+        :param skip_extensions: the file extensions of the URLs not queued, by default SKIPPED_EXTENSIONS
+        :type skip_extensions: list
+        :param skip_patterns: additional regular expressions of the URLs not queued, if any
+        :type skip_patterns: list
+        :param remove_index_pages: whether index pages ('index.html', ...) are replaced by their directory
+        :type remove_index_pages: bool
+        :param trailing_slash: 'keep' to leave the paths as linked, as servers usually redirect '/docs' to '/docs/'
+        rather than the other way, or 'strip' to remove the trailing slash of non-root paths
+        :type trailing_slash: str
+        """
+        if trailing_slash not in ('strip', 'keep'):
+            raise ValueError("Unknown trailing slash policy '" + str(trailing_slash) + "', expected 'strip' or 'keep'")
+        self.keep_all_query = keep_query_params is None
+        self.keep_query_regex = compile_wildcards(keep_query_params)
+        self.strip_query_regex = compile_wildcards(STRIPPED_QUERY_PARAMS if strip_query_params is None
+                                                   else strip_query_params)
+        extensions = SKIPPED_EXTENSIONS if skip_extensions is None else skip_extensions
+        extension_regex = r'\.(?:' + '|'.join(re.escape(ext.strip().lower()) for ext in extensions) + r')$'
+        self.skip_path_regex = re.compile(extension_regex, re.IGNORECASE) if extensions else None
+        self.skip_url_regex = re.compile('|'.join('(?:' + pattern + ')' for pattern in skip_patterns)) \
+            if skip_patterns else None
+        self.remove_index_pages = remove_index_pages
+        self.trailing_slash = trailing_slash
+
+    def canonicalize(self, url):
+        """
+        :param url: an absolute URL
+        :return: the canonical form of the URL: lower-case scheme and host, no default port, resolved dot segments,
+        no index page (unless there is a query) and fragment, filtered query parameters, and no trailing slash if
+        stripped; None if the URL is invalid
+        """
+        try:
+            parsed = urlsplit(url.strip())
+            port = parsed.port
+        except ValueError:
+            return None
+        scheme = parsed.scheme.lower()
+        host = (parsed.hostname or '').rstrip('.')
+        if ':' in host:
+            host = '[' + host + ']'
+        netloc = host
+        if port is not None and DEFAULT_PORTS.get(scheme) != port:
+            netloc = netloc + ':' + str(port)
+        if parsed.username is not None:
+            userinfo = parsed.username if parsed.password is None else parsed.username + ':' + parsed.password
+            netloc = userinfo + '@' + netloc
+        path = remove_dot_segments(parsed.path) or '/'
+        # query-routed sites ('index.php?about') may not serve the same page for the directory
+        if self.remove_index_pages and not parsed.query:
+            directory, _, page = path.rpartition('/')
+            if page.lower() in INDEX_PAGES:
+                path = directory + '/'
+        if self.trailing_slash == 'strip' and len(path) > 1 and path.endswith('/'):
+            path = path.rstrip('/') or '/'
+        return urlunsplit((scheme, netloc, path, self.canonical_query(parsed.query), ''))
+
+    def canonical_query(self, query):
+        """
+        :param query: the query string of a URL
+        :return: the query string without its dropped parameters, the kept ones left byte for byte and in their order,
+        as the server may route on their exact form
+        """
+        if not query:
+            return ''
+        params = []
+        for param in query.split('&'):
+            if not param:
+                continue
+            name = unquote_plus(param.partition('=')[0])
+            if self.strip_query_regex is not None and self.strip_query_regex.match(name):
+                continue
+            if not self.keep_all_query and (self.keep_query_regex is None or not self.keep_query_regex.match(name)):
+                continue
+            params.append(param)
+        return '&'.join(params)
+
+    def seen_key(self, url):
+        """
+        :param url: a canonical URL
+        :return: the key of the URL in the seen-URL sets, without trailing slash, so '/docs' and '/docs/' are crawled
+        once whichever form is linked
+        """
+        parsed = urlsplit(url)
+        if len(parsed.path) > 1 and parsed.path.endswith('/'):
+            return urlunsplit(parsed._replace(path=parsed.path.rstrip('/') or '/'))
+        return url
+
+    def is_skipped(self, url):
+        """
+        :param url: the URL to be checked
+        :return: True if the URL is a document/image/executable or matches a skip pattern, False if not
+        """
+        if self.skip_path_regex is not None and self.skip_path_regex.search(urlsplit(url).path):
+            return True
+        return self.skip_url_regex is not None and self.skip_url_regex.search(url) is not None
+
+
+OUTPUT_FIELDS = ['_id', 'url', 'domain_name', 'created_time', 'html_char_length', 'text_char_length',
+                 'textual_tags_cnt', 'label', 'label_details', 'source', 'geo_loc', 'url_length', 'domain_length',
+                 'tld', 'protocol', 'time_response', 'tls_ssl_certificate', 'visual_content_no',
+                 'visual_content_src', 'text', 'html']
+
+OUTPUT_PROFILES = {
+    'links-only': ['_id', 'url', 'domain_name', 'created_time', 'label', 'label_details', 'source', 'url_length',
+                   'domain_length', 'protocol', 'time_response'],
+    'text': ['_id', 'url', 'domain_name', 'created_time', 'html_char_length', 'text_char_length',
+             'textual_tags_cnt', 'label', 'label_details', 'source', 'url_length', 'domain_length', 'protocol',
+             'time_response', 'text'],
+    'full': OUTPUT_FIELDS,
+}
+
+
+def resolve_output_fields(fields):
+    """
+    :param fields: a profile name of OUTPUT_PROFILES, a list of field names of OUTPUT_FIELDS, or None for 'full'
+    :return: the list of output field names to be saved for each webpage
+    """
+    if fields is None:
+        return list(OUTPUT_PROFILES['full'])
+    if isinstance(fields, str):
+        if fields not in OUTPUT_PROFILES:
+            raise ValueError("Unknown output profile '" + fields + "', expected one of "
+                             + ", ".join(OUTPUT_PROFILES))
+        return list(OUTPUT_PROFILES[fields])
+    unknown = [field for field in fields if field not in OUTPUT_FIELDS]
+    if unknown:
+        raise ValueError("Unknown output fields: " + ", ".join(unknown))
+    return list(dict.fromkeys(fields))
+
+
+class PageFeatures:
+    """
+    This class computes the output features of a scraped webpage lazily, each feature is computed on first access
+    and cached, so the features that are not requested never run
+    """
+    def __init__(self, crawler, url, html, soup, time_response):
+        """
+        :param crawler: the WebCrawling object scraping the webpage
+        :type crawler: WebCrawling
+        :param url: the URL of the webpage
+        :type url: str
+        :param html: the html source of the webpage
+        :type html: bytes
+        :param soup: Beautiful soup object of the webpage HTML
+        :type soup: BeautifulSoup
+        :param time_response: the response time of the webpage in seconds
+        :type time_response: float
+        """
+        self.crawler = crawler
+        self.url = url
+        self.html = html
+        self.soup = soup
+        self.time_response = time_response
+        self.cache = {}
+
+    def get(self, field):
+        """
+        :param field: the name of the feature, one of OUTPUT_FIELDS
+        :return: the value of the feature, computed once
+        """
+        if field not in self.cache:
+            name = 'url' if field == '_id' else field
+            self.cache[field] = getattr(self, 'compute_' + name)()
+        return self.cache[field]
+
+    def is_computed(self, field):
+        """
+        :param field: the name of the feature
+        :return: True if the feature has already been computed, False if not
+        """
+        return field in self.cache
+
+    def to_dict(self, fields):
+        """
+        :param fields: the list of the requested feature names
+        :return: the dictionary of the requested features of the webpage
+        """
+        return {field: self.get(field) for field in fields}
+
+    def visible_text(self):
+        """
+        :return: the list of the visible, non-empty text elements of the webpage
+        """
+        if 'visible_text' not in self.cache:
+            p_texts = self.soup.findAll(text=True)
+            filtered_prev_texts = list(filter(tag_visible, p_texts))
+            cleaned_prev_text = [x for x in filtered_prev_texts if x]
+            prev_text = [x for x in cleaned_prev_text if x != ' ']
+            self.cache['visible_text'] = [x for x in prev_text if x != '\n']
+        return self.cache['visible_text']
+
+    def visuals(self):
+        """
+        :return: the list of visual sources of the webpage
+        """
+        if 'visuals' not in self.cache:
+            self.cache['visuals'] = get_visual_content(self.soup)
+        return self.cache['visuals']
+
+    def compute_url(self):
+        return self.url
+
+    def compute_domain_name(self):
+        extracted = tldextract.extract(self.url)
+        return "{}.{}".format(extracted.domain, extracted.suffix)
+
+    def compute_created_time(self):
+        return time.strftime('%Y-%m-%d %H:%M:%S')
+
+    def compute_html_char_length(self):
+        return len(self.html)
+
+    def compute_text_char_length(self):
+        return sum([len(t) for t in self.visible_text()])
+
+    def compute_textual_tags_cnt(self):
+        return len(self.visible_text())
+
+    def compute_label(self):
+        return self.crawler.label
+
+    def compute_label_details(self):
+        return self.crawler.label_details
+
+    def compute_source(self):
+        return self.crawler.source
+
+    def compute_geo_loc(self):
+        return self.crawler.lookup_geo_loc(self.url)
+
+    def compute_url_length(self):
+        return len(self.url)
+
+    def compute_domain_length(self):
+        return len(self.get('domain_name'))
+
+    def compute_tld(self):
+        return get_url_tld(self.url)
+
+    def compute_protocol(self):
+        return urlparse(self.url).scheme
+
+    def compute_time_response(self):
+        return self.time_response
+
+    def compute_tls_ssl_certificate(self):
+        return get_tls_ssl_certificate(self.url)
+
+    def compute_visual_content_no(self):
+        return len(self.visuals())
+
+    def compute_visual_content_src(self):
+        return [link['link'] for link in self.visuals()]
+
+    def compute_text(self):
+        return self.visible_text()
+
+    def compute_html(self):
+        return str(self.soup)
+
+
+class FetchError(Exception):
+    """
+    Raised by the fetch layer when a URL could not be retrieved
+    """
+    def __init__(self, url, error_class, status_code=None):
+        """
+        :param url: the URL that failed to be fetched
+        :type url: str
+        :param error_class: the class of the failure ('dns', 'connect', 'tls', 'timeout', 'http', 'circuit_open'
+        or 'unknown')
+        :type error_class: str
+        :param status_code: the HTTP status code of the failure, if any
+        :type status_code: int
+        """
+        self.url = url
+        self.error_class = error_class
+        self.status_code = status_code
+        message = error_class if status_code is None else error_class + " " + str(status_code)
+        super().__init__(message + " error for " + url)
+
+
+class CircuitOpenError(FetchError):
+    """
+    Raised instead of fetching when the circuit breaker of the URL host is open
+    """
+    def __init__(self, url):
+        super().__init__(url, 'circuit_open')
+
+
+class DeadlineExceeded(FetchError):
+    """
+    Raised when a fetch is not started or is cancelled because its deadline has expired
+    """
+    def __init__(self, url):
+        super().__init__(url, 'deadline')
+
+
+class Deadline:
+    """
+    This class is a wall-clock deadline shared by the fetch, parse and export stages of a crawl, a child deadline
+    never expires after its parent and is cancelled together with it
+    """
+    def __init__(self, expires_at=None, parent=None):
+        """
+        :param expires_at: the epoch time in seconds at which the deadline expires, None for no limit
+        :type expires_at: float
+        :param parent: the enclosing deadline, if any
+        :type parent: Deadline
+        """
+        if parent is not None and parent.expires_at is not None:
+            expires_at = parent.expires_at if expires_at is None else min(expires_at, parent.expires_at)
+        self.expires_at = expires_at
+        self.cancelled = parent.cancelled if parent is not None else threading.Event()
+
+    def remaining(self):
+        """
+        :return: the number of seconds left before the deadline, None if there is no limit
+        """
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.time())
+
+    def expired(self):
+        """
+        :return: True if the deadline has passed or has been cancelled, False if not
+        """
+        if self.cancelled.is_set():
+            return True
+        return self.expires_at is not None and time.time() >= self.expires_at
+
+    def cancel(self):
+        """
+        this function cancels the deadline and every child deadline created from it
+        :return: None
+        """
+        self.cancelled.set()
+
+    def cap(self, timeout):
+        """
+        :param timeout: the timeout of an operation in seconds
+        :return: the given timeout, shortened so the operation does not outlive the deadline
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        return max(0.01, min(timeout, remaining))
+
+    def wait(self, seconds):
+        """
+        this function sleeps for the given duration, waking up early if the deadline expires or is cancelled
+        :param seconds: the number of seconds to sleep
+        :return: True if the deadline has expired, False if not
+        """
+        self.cancelled.wait(self.cap(seconds))
+        return self.expired()
+
+
+def classify_fetch_error(err):
+    """
+    :param err: the exception raised while fetching a URL
+    :return: the class of the failure, one of 'dns', 'connect', 'tls', 'timeout', 'http' or 'unknown'
+    """
+    if isinstance(err, urllib.error.HTTPError):
+        return 'http'
+    if isinstance(err, urllib.error.URLError) and isinstance(err.reason, BaseException):
+        err = err.reason
+    if isinstance(err, socket.gaierror):
+        return 'dns'
+    if isinstance(err, ssl.SSLError):
+        return 'tls'
+    if isinstance(err, (socket.timeout, TimeoutError)):
+        return 'timeout'
+    if isinstance(err, (ConnectionError, OSError)):
+        return 'connect'
+    return 'unknown'
+
+
+def is_retryable_error(error_class, status_code=None):
+    """
+    :param error_class: the class of the fetch failure
+    :param status_code: the HTTP status code of the failure, if any
+    :return: True if the failure is transient and the request is worth retrying, False if not
+    """
+    if error_class in ('connect', 'timeout'):
+        return True
+    if error_class == 'http' and status_code is not None:
+        return status_code == 429 or status_code >= 500
+    return False
+
+
+def is_host_failure(error_class, status_code=None):
+    """
+    :param error_class: the class of the fetch failure
+    :param status_code: the HTTP status code of the failure, if any
+    :return: True if the failure indicates the host itself is unhealthy, False if the host answered normally
+    """
+    if error_class in ('dns', 'connect', 'tls', 'timeout'):
+        return True
+    if error_class == 'http' and status_code is not None:
+        return status_code >= 500
+    return False
+
+
+def parse_retry_after(value):
+    """
+    :param value: the Retry-After header of a response, in seconds or as an HTTP date
+    :return: the number of seconds to wait before retrying, None if the header is missing or invalid
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class HostCircuitBreaker:
+    """
+    This class tracks consecutive fetch failures per host and fails fast once a host is considered down, and bounds
+    the retries sent to each host to a fraction of its recent requests (retry budget)
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=300, retry_budget_ratio=0.2, retry_budget_window=60,
+                 min_retries=3):
+        """
+        :param failure_threshold: the number of consecutive host failures that opens the circuit of the host
+        :type failure_threshold: int
+        :param reset_timeout: the number of seconds an open circuit waits before letting a single probe request through
+        :type reset_timeout: int
+        :param retry_budget_ratio: the number of retries allowed per request sent to a host within the budget window
+        :type retry_budget_ratio: float
+        :param retry_budget_window: the length in seconds of the window the retries and requests of a host are counted
+        over
+        :type retry_budget_window: float
+        :param min_retries: the number of retries always allowed within the window, so hosts with few requests can
+        still be retried
+        :type min_retries: int
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.retry_budget_ratio = retry_budget_ratio
+        self.retry_budget_window = retry_budget_window
+        self.min_retries = min_retries
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def get_host(self, host):
+        """
+        :param host: the host name
+        :return: the breaker state dictionary of the given host, created if missing
+        """
+        if host not in self.hosts:
+            self.hosts[host] = {'state': 'closed', 'failures': 0, 'trips': 0, 'opened_at': None, 'probing': False,
+                                'requests': collections.deque(), 'retries': collections.deque(), 'retries_denied': 0}
+        return self.hosts[host]
+
+    def record_request(self, host):
+        """
+        :param host: the host a new request (not a retry) is sent to
+        :return: None
+        """
+        with self.lock:
+            self.get_host(host)['requests'].append(time.time())
+
+    def allow_retry(self, host):
+        """
+        :param host: the host a failed request is about to be retried against
+        :return: True if the retry budget of the host allows the retry, which is then counted, False if not
+        """
+        with self.lock:
+            entry = self.get_host(host)
+            now = time.time()
+            for timestamps in (entry['requests'], entry['retries']):
+                while timestamps and now - timestamps[0] > self.retry_budget_window:
+                    timestamps.popleft()
+            if len(entry['retries']) >= max(self.min_retries, self.retry_budget_ratio * len(entry['requests'])):
+                entry['retries_denied'] = entry['retries_denied'] + 1
+                return False
+            entry['retries'].append(now)
+            return True
+
+    def allow_request(self, host):
+        """
+        :param host: the host about to be requested
+        :return: True if a request to the given host may be sent, False if the circuit is open
+        """
+        with self.lock:
+            entry = self.get_host(host)
+            if entry['state'] == 'closed':
+                return True
+            if entry['state'] == 'open':
+                if time.time() - entry['opened_at'] < self.reset_timeout:
+                    return False
+                entry['state'] = 'half_open'
+            if entry['probing']:
+                return False
+            entry['probing'] = True
+            return True
+
+    def record_success(self, host):
+        """
+        :param host: the host that answered the request
+        :return: None
+        """
+        with self.lock:
+            entry = self.get_host(host)
+            entry['state'] = 'closed'
+            entry['failures'] = 0
+            entry['opened_at'] = None
+            entry['probing'] = False
+
+    def record_failure(self, host):
+        """
+        :param host: the host that failed to answer the request
+        :return: None
+        """
+        with self.lock:
+            entry = self.get_host(host)
+            entry['failures'] = entry['failures'] + 1
+            entry['probing'] = False
+            if entry['state'] == 'half_open' or entry['failures'] >= self.failure_threshold:
+                if entry['state'] != 'open':
+                    entry['trips'] = entry['trips'] + 1
+                    logger.warning("Circuit breaker opened for host %s after %d consecutive failures", host,
+                                   entry['failures'])
+                entry['state'] = 'open'
+                entry['opened_at'] = time.time()
+
+    def snapshot(self):
+        """
+        :return: dictionary of the breaker state, consecutive failures, number of trips and number of retries denied
+        by the retry budget of every seen host
+        """
+        with self.lock:
+            return {host: {'state': entry['state'], 'failures': entry['failures'], 'trips': entry['trips'],
+                           'retries_denied': entry['retries_denied']}
+                    for host, entry in self.hosts.items()}
+
+
+EXACT_SEEN_THRESHOLD = 1000
+
+
+class ExactSeenSet:
+    """
+    This class is an exact in-memory set of seen URLs, used for small crawls
+    """
+    def __init__(self):
+        self.urls = set()
+        self.lock = threading.Lock()
+
+    def add(self, url):
+        """
+        :param url: the URL to be marked as seen
+        :return: True if the URL was not seen before, False if it was
+        """
+        with self.lock:
+            if url in self.urls:
+                return False
+            self.urls.add(url)
+            return True
+
+    def __contains__(self, url):
+        return url in self.urls
+
+    def __len__(self):
+        return len(self.urls)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class BloomSeenSet:
+    """
+    This class is a compact probabilistic set of seen URLs (Bloom filter) of a fixed memory footprint, stored in a
+    memory-mapped file so it can be shared by several worker processes at once and reused by later recrawls
+    """
+    MAGIC = b'CSBLOOM1'
+    HEADER = struct.Struct('<8sQQQ')
+
+    def __init__(self, path=None, capacity=1000000, error_rate=0.001):
+        """
+        :param path: the file of the filter, opened if it exists and created if not, None for a private
+        in-memory filter
+        :type path: str
+        :param capacity: the number of URLs the filter is sized for
+        :type capacity: int
+        :param error_rate: the false-positive rate of the filter once it holds capacity URLs
+        :type error_rate: float
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+        bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        hashes = max(1, int(round(bits / capacity * math.log(2))))
+        size = self.HEADER.size + (bits + 7) // 8
+        if path is None:
+            self.map = mmap.mmap(-1, size)
+            self.HEADER.pack_into(self.map, 0, self.MAGIC, bits, hashes, 0)
+        else:
+            if os.path.dirname(path) and check_file(path) == -1:
+                raise OSError("Unable to create the directory of " + path)
+            self.file = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT), 'r+b')
+            with self.file_lock():
+                self.file.seek(0, os.SEEK_END)
+                if self.file.tell() == 0:
+                    self.file.truncate(size)
+                    self.file.seek(0)
+                    self.file.write(self.HEADER.pack(self.MAGIC, bits, hashes, 0))
+                    self.file.flush()
+            self.map = mmap.mmap(self.file.fileno(), 0)
+        magic, self.bits, self.hashes = self.HEADER.unpack_from(self.map, 0)[:3]
+        if magic != self.MAGIC:
+            raise ValueError("Not a seen-URL filter file: " + str(path))
+
+    @contextlib.contextmanager
+    def file_lock(self):
+        """
+        this function holds the thread lock and, for file-backed filters, an exclusive lock on the file shared with
+        other processes
+        """
+        with self.lock:
+            if self.file is not None and fcntl is not None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if self.file is not None and fcntl is not None:
+                    fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+
+    def positions(self, url):
+        """
+        :param url: the URL to be hashed
+        :return: the bit positions of the URL in the filter (double hashing of a 128-bit blake2b digest)
+        """
+        digest = hashlib.blake2b(url.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, url):
+        """
+        :param url: the URL to be marked as seen
+        :return: True if the URL was not seen before, False if it was (or is a false positive)
+        """
+        offset = self.HEADER.size
+        with self.file_lock():
+            added = False
+            for position in self.positions(url):
+                index = offset + position // 8
+                mask = 1 << (position % 8)
+                byte = self.map[index]
+                if not byte & mask:
+                    self.map[index] = byte | mask
+                    added = True
+            if added:
+                count = self.HEADER.unpack_from(self.map, 0)[3]
+                self.HEADER.pack_into(self.map, 0, self.MAGIC, self.bits, self.hashes, count + 1)
+            return added
+
+    def __contains__(self, url):
+        offset = self.HEADER.size
+        for position in self.positions(url):
+            if not self.map[offset + position // 8] & (1 << (position % 8)):
+                return False
+        return True
+
+    def __len__(self):
+        return self.HEADER.unpack_from(self.map, 0)[3]
+
+    def flush(self):
+        """
+        this function writes the filter to its file, so a later recrawl can reuse it
+        :return: None
+        """
+        if self.file is not None:
+            self.map.flush()
+
+    def close(self):
+        """
+        this function flushes and releases the filter
+        :return: None
+        """
+        self.flush()
+        self.map.close()
+        if self.file is not None:
+            self.file.close()
+
+
+def open_seen_set(path=None, capacity=1000000, error_rate=0.001, exact=False):
+    """
+    :param path: the file of a shared and persistent filter, if any
+    :param capacity: the number of URLs the filter is sized for
+    :param error_rate: the false-positive rate of the filter
+    :param exact: whether an exact in-memory set is used instead of a filter when no file is given
+    :return: an ExactSeenSet or BloomSeenSet object
+    """
+    if path is None and exact:
+        return ExactSeenSet()
+    return BloomSeenSet(path, capacity, error_rate)
+
+
+# from Python 3.12 cProfile runs on sys.monitoring: a single profiler sees every thread, and enabling a second one
+# while it is active raises ValueError; the calls of concurrent threads are then counted as recursive calls
+PROFILE_ALL_THREADS = sys.version_info >= (3, 12)
+
+
+class CrawlProfiler:
+    """
+    This class profiles a crawling run across all worker threads, with a deterministic profiler (cProfile) or a
+    low-overhead sampling profiler, and attributes wall time per pipeline stage and per site
+    """
+    def __init__(self, mode, output_directory, interval=0.005, trace_allocations=None, top_allocations=25):
+        """
+        :param mode: 'deterministic' for cProfile in every worker thread (a single cProfile of the whole run from
+        Python 3.12), or 'sampling' for periodic stack samples
+        :type mode: str
+        :param output_directory: the directory of the profiling output files
+        :type output_directory: str
+        :param interval: the sampling interval in seconds of the sampling profiler
+        :type interval: float
+        :param trace_allocations: whether the top allocation sites are traced with tracemalloc, by default only in
+        deterministic mode as tracing slows down every allocation
+        :type trace_allocations: bool
+        :param top_allocations: the number of allocation sites reported
+        :type top_allocations: int
+        """
+        if mode not in ('deterministic', 'sampling'):
+            raise ValueError("Unknown profiling mode '" + str(mode) + "', expected 'deterministic' or 'sampling'")
+        self.mode = mode
+        self.output_directory = output_directory
+        self.interval = interval
+        self.trace_allocations = mode == 'deterministic' if trace_allocations is None else trace_allocations
+        self.top_allocations = top_allocations
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.profiles = []
+        self.stage_times = {}
+        self.contexts = {}
+        self.stacks = {}
+        self.stop_event = threading.Event()
+        self.sampler = None
+        self.run_profile = None
+
+    def start(self):
+        """
+        this function starts the allocation tracing, the profiler of the whole run (deterministic mode from
+        Python 3.12) and the sampling thread, if enabled
+        :return: None
+        """
+        if self.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.mode == 'deterministic' and PROFILE_ALL_THREADS:
+            self.run_profile = cProfile.Profile()
+            self.profiles.append(self.run_profile)
+            self.run_profile.enable()
+        if self.mode == 'sampling':
+            self.sampler = threading.Thread(target=self.sample, daemon=True)
+            self.sampler.start()
+
+    @contextlib.contextmanager
+    def stage(self, site, name):
+        """
+        this function measures the wall time of a pipeline stage of a site in the current thread, and profiles the
+        thread while any stage is running in it
+        :param site: the target URL being crawled
+        :param name: the name of the pipeline stage
+        """
+        thread_id = threading.get_ident()
+        depth = getattr(self.local, 'depth', 0)
+        per_thread = self.mode == 'deterministic' and not PROFILE_ALL_THREADS
+        if per_thread and depth == 0:
+            if getattr(self.local, 'profile', None) is None:
+                self.local.profile = cProfile.Profile()
+                with self.lock:
+                    self.profiles.append(self.local.profile)
+            self.local.profile.enable()
+        self.local.depth = depth + 1
+        with self.lock:
+            self.contexts.setdefault(thread_id, []).append((site, name))
+        time_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - time_start
+            with self.lock:
+                self.contexts[thread_id].pop()
+                entry = self.stage_times.setdefault(site, {}).setdefault(name, {'calls': 0, 'seconds': 0.0})
+                entry['calls'] = entry['calls'] + 1
+                entry['seconds'] = entry['seconds'] + elapsed
+            self.local.depth = depth
+            if per_thread and depth == 0:
+                self.local.profile.disable()
+
+    def sample(self):
+        """
+        this function periodically records the stacks of the threads running a pipeline stage as collapsed stacks
+        prefixed with their site and stage
+        :return: None
+        """
+        own_id = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            with self.lock:
+                contexts = {thread_id: context[-1] for thread_id, context in self.contexts.items() if context}
+            for thread_id, (site, name) in contexts.items():
+                frame = frames.get(thread_id)
+                if thread_id == own_id or frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(code.co_name + ' (' + os.path.basename(code.co_filename) + ':'
+                                 + str(code.co_firstlineno) + ')')
+                    frame = frame.f_back
+                key = ';'.join([site.replace(';', ''), name] + stack[::-1])
+                with self.lock:
+                    self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def stop(self):
+        """
+        this function stops profiling and writes the output files to the output directory:
+        profile.pstats (deterministic mode), profile.collapsed (sampling mode, for flamegraph tools),
+        profile_stages.json (wall time per site and stage, nested stages included in their enclosing stage) and
+        profile_allocations.txt (top allocation sites)
+        :return: None
+        """
+        self.stop_event.set()
+        if self.sampler is not None:
+            self.sampler.join()
+        if self.run_profile is not None:
+            self.run_profile.disable()
+        if check_file(self.output_directory) == -1:
+            return
+        if self.profiles:
+            stats = pstats.Stats(self.profiles[0])
+            for profile in self.profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(self.output_directory + 'profile.pstats')
+        if self.mode == 'sampling':
+            with open(self.output_directory + 'profile.collapsed', 'w') as f:
+                for key, count in sorted(self.stacks.items()):
+                    f.write(key + ' ' + str(count) + '\n')
+        with open(self.output_directory + 'profile_stages.json', 'w') as f:
+            json.dump(self.stage_times, f, indent=2)
+        if self.trace_allocations and tracemalloc.is_tracing():
+            statistics = tracemalloc.take_snapshot().statistics('lineno')
+            tracemalloc.stop()
+            with open(self.output_directory + 'profile_allocations.txt', 'w') as f:
+                for stat in statistics[:self.top_allocations]:
+                    f.write(str(stat) + '\n')
+        logger.info("Profiling results saved to %s", self.output_directory)
+
+
+class WarcWriter:
+    """
+    This class records raw fetch results into a gzip-compressed WARC/1.0 file, one gzip member per record
+    """
+    def __init__(self, path, site):
+        """
+        :param path: the WARC file, appended to if it exists
+        :type path: str
+        :param site: the target URL recorded in the warcinfo record of the file
+        :type site: str
+        """
+        if os.path.dirname(path) and check_file(path) == -1:
+            raise OSError("Unable to create the directory of " + path)
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'ab')
+        self.write_record('warcinfo', None, 'application/warc-fields',
+                          ('software: CrawlScrape\r\nsite: ' + site + '\r\n').encode('utf-8'))
+
+    def write_record(self, record_type, target_uri, content_type, payload, extra_headers=None):
+        """
+        this function appends a single WARC record to the file
+        :param record_type: the WARC-Type of the record
+        :param target_uri: the WARC-Target-URI of the record, if any
+        :param content_type: the Content-Type of the record block
+        :param payload: the record block
+        :param extra_headers: list of additional (name, value) WARC header fields
+        :return: None
+        """
+        headers = [('WARC-Type', record_type),
+                   ('WARC-Record-ID', '<urn:uuid:' + str(uuid.uuid4()) + '>'),
+                   ('WARC-Date', datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'))]
+        if target_uri is not None:
+            headers.append(('WARC-Target-URI', target_uri))
+        headers.extend(extra_headers or [])
+        headers.extend([('Content-Type', content_type), ('Content-Length', str(len(payload)))])
+        block = ('WARC/1.0\r\n' + ''.join(name + ': ' + value + '\r\n' for name, value in headers) +
+                 '\r\n').encode('utf-8') + payload + b'\r\n\r\n'
+        with self.lock:
+            self.file.write(gzip.compress(block))
+            self.file.flush()
+
+    def write_response(self, url, final_url, code, headers, body, duration):
+        """
+        this function records an HTTP response
+        :param url: the requested URL
+        :param final_url: the URL of the response after redirects
+        :param code: the HTTP status code
+        :param headers: the HTTP response headers
+        :param body: the response body
+        :param duration: the fetch duration in seconds
+        :return: None
+        """
+        status_line = 'HTTP/1.1 ' + str(code) + ' ' + http.client.responses.get(code, '') + '\r\n'
+        header_lines = ''.join(name + ': ' + value + '\r\n' for name, value in headers.items()
+                               if name.lower() != 'transfer-encoding')
+        payload = (status_line + header_lines + '\r\n').encode('iso-8859-1', 'replace') + body
+        self.write_record('response', final_url, 'application/http;msgtype=response', payload,
+                          [('WARC-Requested-URI', url), ('WARC-Fetch-Duration', str(duration))])
+
+    def write_error(self, url, error_class):
+        """
+        this function records a fetch that failed without an HTTP response
+        :param url: the requested URL
+        :param error_class: the class of the fetch failure
+        :return: None
+        """
+        self.write_record('metadata', url, 'application/json', json.dumps({'fetch_error': error_class}).encode())
+
+    def write_metadata(self, url, values):
+        """
+        this function records features of a URL obtained from other services, such as its geographical location
+        :param url: the URL the values belong to
+        :param values: dictionary of the values
+        :return: None
+        """
+        self.write_record('metadata', url, 'application/json', json.dumps(values).encode())
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def read_warc_records(path):
+    """
+    :param path: a gzip-compressed or plain WARC file
+    :return: generator of (headers dictionary, record block) of every record of the file
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        while True:
+            line = f.readline()
+            if not line:
+                return
+            if not line.strip():
+                continue
+            if not line.startswith(b'WARC/'):
+                raise ValueError("Invalid WARC record in " + path)
+            headers = {}
+            line = f.readline()
+            while line.strip():
+                name, value = line.decode('utf-8').split(':', 1)
+                headers[name.strip()] = value.strip()
+                line = f.readline()
+            yield headers, f.read(int(headers['Content-Length']))
+
+
+class WarcArchive:
+    """
+    This class serves fetches from a WARC file recorded by WarcWriter, for offline replay without network
+    """
+    def __init__(self, path):
+        """
+        :param path: the WARC file of the target URL
+        :type path: str
+        """
+        self.path = path
+        self.site = None
+        self.responses = {}
+        self.metadata = {}
+        for headers, block in read_warc_records(path):
+            record_type = headers.get('WARC-Type')
+            if record_type == 'warcinfo':
+                for line in block.decode('utf-8').splitlines():
+                    if line.startswith('site:'):
+                        self.site = line.split(':', 1)[1].strip()
+            elif record_type == 'response':
+                url = headers.get('WARC-Requested-URI', headers.get('WARC-Target-URI'))
+                head, _, body = block.partition(b'\r\n\r\n')
+                code = int(head.split(b' ', 2)[1])
+                duration = float(headers.get('WARC-Fetch-Duration', 0))
+                self.responses[url] = (headers.get('WARC-Target-URI'), code, body, duration)
+            elif record_type == 'metadata':
+                values = json.loads(block.decode('utf-8'))
+                url = headers.get('WARC-Target-URI')
+                if 'fetch_error' in values:
+                    self.responses[url] = values['fetch_error']
+                else:
+                    self.metadata.setdefault(url, {}).update(values)
+
+    def replay(self, url):
+        """
+        :param url: the requested URL
+        :return: tuple of the final URL after redirects, the HTTP status code, the response body and the recorded
+        fetch duration in seconds
+        :raises FetchError: if the fetch failed when it was recorded, or the URL is not in the archive
+        """
+        if url not in self.responses:
+            raise FetchError(url, 'not_archived')
+        response = self.responses[url]
+        if isinstance(response, str):
+            raise FetchError(url, response)
+        if response[1] >= 400:
+            raise FetchError(url, 'http', response[1])
+        return response
+
+    def get_metadata(self, url, name):
+        """
+        :param url: the URL the value belongs to
+        :param name: the name of the value
+        :return: the recorded value, None if it was not recorded
+        """
+        return self.metadata.get(url, {}).get(name)
+
+
 class WebCrawling:
     """
     This class will crawl a specify URL and scrape each of the extracted internal URLs
     """
     def __init__(self, url, file_n, label, label_details, max_crawling,
-                 collection_source, crawl_time_out):
+                 collection_source, crawl_time_out, max_retries=2, backoff_base=1, backoff_max=30,
+                 breaker_threshold=5, breaker_reset_timeout=300, retry_budget_ratio=0.2, retry_budget_window=60,
+                 output_fields=None, page_time_out=None,
+                 run_deadline=None, seen_urls_file=None, seen_urls_capacity=1000000, seen_urls_error_rate=0.001,
+                 profiler=None, archive_file=None, archive_mode=None, keep_query_params=None,
+                 strip_query_params=None, skip_url_patterns=None, remove_index_pages=True, trailing_slash='keep'):
         """
         :param url: the target URL to be crawled
         :type url: str
@@ -125,12 +1445,66 @@ class WebCrawling:
         :type collection_source: str
         :param crawl_time_out: the limit of crawling the target URL in seconds
         :type crawl_time_out: int
+        :param max_retries: the number of retries of a transient fetch failure (timeout, connection, HTTP 429/5xx)
+        :type max_retries: int
+        :param backoff_base: the base delay in seconds of the jittered exponential backoff between retries
+        :type backoff_base: float
+        :param backoff_max: the maximum delay in seconds between retries
+        :type backoff_max: float
+        :param breaker_threshold: the number of consecutive failures of a host before failing its remaining URLs fast
+        :type breaker_threshold: int
+        :param breaker_reset_timeout: the number of seconds before an open host circuit is probed again
+        :type breaker_reset_timeout: int
+        :param retry_budget_ratio: the number of retries allowed per request sent to a host within the retry budget
+        window, bounding the retries of hosts that fail intermittently
+        :type retry_budget_ratio: float
+        :param retry_budget_window: the length in seconds of the window of the retry budget of each host
+        :type retry_budget_window: float
+        :param output_fields: the fields saved for each webpage, a profile name of OUTPUT_PROFILES ('links-only',
+        'text', 'full') or a list of OUTPUT_FIELDS, by default 'full'
+        :type output_fields: str or list
+        :param page_time_out: the limit of fetching, parsing and saving a single webpage in seconds, if any
+        :type page_time_out: int
+        :param run_deadline: the epoch time in seconds at which the whole crawling run must stop, if any
+        :type run_deadline: float
+        :param seen_urls_file: the file of a filter of the saved URLs, shared between processes and kept for
+        incremental recrawls, the webpages already saved in it are not saved again but their links are still followed,
+        if any
+        :type seen_urls_file: str
+        :param seen_urls_capacity: the number of URLs the seen-URL filters are sized for
+        :type seen_urls_capacity: int
+        :param seen_urls_error_rate: the false-positive rate of the seen-URL filters
+        :type seen_urls_error_rate: float
+        :param profiler: the profiler of the crawling run, if any
+        :type profiler: CrawlProfiler
+        :param archive_file: the WARC file of the raw responses of the target URL, if any
+        :type archive_file: str
+        :param archive_mode: 'record' to record every fetch into archive_file, or 'replay' to serve every fetch from
+        archive_file without network
+        :type archive_mode: str
+        :param keep_query_params: the wildcard patterns of the query parameters kept in the found URLs, None to keep
+        every parameter that is not stripped, an empty list to drop the whole query
+        :type keep_query_params: list
+        :param strip_query_params: the wildcard patterns of the query parameters dropped from the found URLs, by
+        default STRIPPED_QUERY_PARAMS
+        :type strip_query_params: list
+        :param skip_url_patterns: regular expressions of found URLs that are not crawled, in addition to the
+        document/image extensions, if any
+        :type skip_url_patterns: list
+        :param remove_index_pages: whether the index pages ('index.html', ...) of the found URLs are replaced by their
+        directory
+        :type remove_index_pages: bool
+        :param trailing_slash: 'keep' to leave the trailing slash of the found URLs as linked, or 'strip' to remove it
+        :type trailing_slash: str
 
         """
         self.target_url = url
         self.internal_urls = []
-        self.external_unique_domains = []
-        self.external_urls = []
+        exact_seen = max_crawling <= EXACT_SEEN_THRESHOLD
+        self.seen_urls = open_seen_set(None, seen_urls_capacity, seen_urls_error_rate, exact_seen)
+        self.saved_urls = None
+        if seen_urls_file is not None:
+            self.saved_urls = open_seen_set(seen_urls_file, seen_urls_capacity, seen_urls_error_rate)
         self.max_crawling_links = max_crawling
         self.crawl_time_out = crawl_time_out
         self.file_n = file_n
@@ -139,32 +1513,58 @@ class WebCrawling:
         self.label_details = label_details
         self.source = collection_source
         self.added_to_db = 0
+        self.already_saved = 0
         self.ts = time.time()
         self.time_now_org = datetime.utcfromtimestamp(self.ts).strftime('%Y-%m-%d %H:%M:%S')
         self.time_now = self.time_now_org.replace(':', '-')
-        logger.info(" ("+self.target_url+") initiating the crawler ")
+        self.logger = CrawlLoggerAdapter(logger, {'site': url})
+        self.logger.info(" (%s) initiating the crawler ", self.target_url)
         self.first_url = True
         self.first_url_check = True
+        self.seed_redirect = None
         self.total_time_minutes = 0
-        self.extensions_img = ['JPEG', 'GIF', 'PNG ', 'JPG', 'TIFF']
-
-        self.extensions = ['JPEG', 'GIF', 'PNG ', 'EPS', 'AI', 'PDF', 'JPG', 'TIFF', 'PSD', 'INDD', 'RAW', 'DOC',
-                           'DOCM', 'DOCX', 'DOT', 'DOTM', 'DOTX', 'RTF', 'TXT', 'WPS', 'XPS', 'CSV', 'DBF', 'DIF',
-                           'ODS', 'PRN', 'SLK', 'XLA', 'XLAM', 'XLS', 'XLW', 'XPS', 'MP4', 'MP3', 'ODP', 'POT',
-                           'POTM', 'POTX', 'PPA', 'PPS', 'PPTM', 'PPTX', 'RTF', 'WMF', 'XML', 'XPS']
+        self.canonicalizer = UrlCanonicalizer(keep_query_params, strip_query_params, skip_patterns=skip_url_patterns,
+                                              remove_index_pages=remove_index_pages, trailing_slash=trailing_slash)
         self.crawled_number = 0
         self.status = ''
         self.geo_loc = []
         self.tld = []
         self.time_response = []
         self.tls_ssl_certificate = []
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.circuit_breaker = HostCircuitBreaker(breaker_threshold, breaker_reset_timeout, retry_budget_ratio,
+                                                  retry_budget_window)
+        self.fetch_errors = {}
+        self.fetch_errors_lock = threading.Lock()
+        self.output_fields = resolve_output_fields(output_fields)
+        self.page_time_out = page_time_out
+        self.deadline = Deadline(None if crawl_time_out is None else self.ts + crawl_time_out,
+                                 parent=Deadline(run_deadline) if run_deadline is not None else None)
+        self.timed_out = False
+        self.crawl_error = None
+        self.in_flight = set()
+        self.in_flight_lock = threading.Lock()
+        self.site = url
+        self.profiler = profiler
+        self.recorder = None
+        self.archive = None
+        if archive_mode == 'record':
+            self.recorder = WarcWriter(archive_file, url)
+        elif archive_mode == 'replay':
+            self.archive = WarcArchive(archive_file)
+        elif archive_mode is not None:
+            raise ValueError("Unknown archive mode '" + str(archive_mode) + "', expected 'record' or 'replay'")
 
     def start(self):
         """
-        Aims to start the crawling and scraping task for the target URL
+        Aims to start the crawling and scraping task for the target URL, returning partial results once the
+        deadline of the target URL expires
         :return: the metadata resulting of crawling the target URL, which includes:
         'domain': the domain of the target URL,
         'target_url': the target URL itself,
+        'crawling_status': 'Successful', or 'timed_out' if the deadline expired before the crawl finished,
         'geo_loc': the geographical location of all scrapped internal URLs of the target URL,
         'domain_length': the domain character length of the target URL,
         'tld': the top-level domain of the target URL,
@@ -174,30 +1574,47 @@ class WebCrawling:
         'domain_tls_ssl_certificate': whether the target URL uses SSL certificate or not,
         'internal_urls_no': number of crawled internal URLs of the target URL,
         'internal_urls': listing all crawled internal URLs of the target URL,
+        'already_saved_urls_no': number of internal URLs whose webpage was saved by an earlier run (seen_urls_file), so
+        only their links were followed,
         'source': the source of the target URL,
         'label': the first level labeling of the target URL,
         'sub-label': the second level labeling of the target URL,
+        'fetch_errors': number of fetch failures per error class ('dns', 'connect', 'tls', 'timeout', 'http_<code>',
+        'circuit_open', 'unknown'),
+        'circuit_breaker': the circuit breaker state of every requested host,
         """
 
-        logger.info(" ("+self.target_url+") starting the crawler ")
+        self.logger.info(" (%s) starting the crawler ", self.target_url)
         time_start = time.time()
-        self.crawl(self.target_url)
-        self.status = 'Successful'
+        crawler_thread = threading.Thread(target=self.run_crawl, daemon=True)
+        crawler_thread.start()
+        crawler_thread.join(self.deadline.remaining())
+        if crawler_thread.is_alive():
+            self.logger.warning(" (%s) : Time out, cancelling in-flight requests and returning partial results",
+                                self.target_url)
+            self.timed_out = True
+            self.deadline.cancel()
+            self.cancel_in_flight()
+        elif self.crawl_error is not None:
+            raise self.crawl_error
+        self.status = 'timed_out' if self.timed_out else 'Successful'
         self.total_time_minutes = (time.time() - time_start) / 60
-        logger.info("Total time for crawling " + self.target_url + " was " + str(self.total_time_minutes) + " minutes.")
+        self.logger.info("Total time for crawling %s was %s minutes.", self.target_url, self.total_time_minutes)
         meta_data = None
+        internal_urls = list(self.internal_urls)
         tls_ssl_certificate_not_duplicate = list(dict.fromkeys(self.tls_ssl_certificate))
         not_none_tls_ssl_certificate = [x for x in tls_ssl_certificate_not_duplicate if x is not None]
         geo_loc_not_duplicate = list(dict.fromkeys(self.geo_loc))
         not_none_geo_loc = [x for x in geo_loc_not_duplicate if x is not None]
         tld_not_duplicate = list(dict.fromkeys(self.tld))
+        if 'tld' not in self.output_fields or not tld_not_duplicate:
+            tld_not_duplicate = [get_url_tld(self.target_url)]
         extracted = tldextract.extract(self.target_url)
         domain = "{}.{}".format(extracted.domain, extracted.suffix)
-        not_none_response_time = [x for x in self.time_response if x is not None]
+        not_none_response_time = [x for x in list(self.time_response) if x is not None]
         try:
             time_response_avg = sum(not_none_response_time) / len(not_none_response_time)
-        except Exception as err:
-            traceback.print_tb(err.__traceback__)
+        except ZeroDivisionError:
             time_response_avg = None
         try:
             meta_data = {
@@ -211,18 +1628,35 @@ class WebCrawling:
                 'start_scrawling_timestamp': self.time_now_org,
                 'end_scrawling_timestamp': datetime.utcfromtimestamp(time.time()).strftime('%Y-%m-%d %H:%M:%S'),
                 'domain_tls_ssl_certificate': True if True in not_none_tls_ssl_certificate else False,
-                'internal_urls_no': len(self.internal_urls),
-                'internal_urls': self.internal_urls,
+                'internal_urls_no': len(internal_urls),
+                'internal_urls': internal_urls,
+                'already_saved_urls_no': self.already_saved,
                 'source': self.source,
                 'label': self.label,
                 'sub-label': self.label_details,
+                'fetch_errors': self.fetch_errors.copy(),
+                'circuit_breaker': self.circuit_breaker.snapshot(),
             }
-        except Exception as err:
-            traceback.print_tb(err.__traceback__)
-            logger.error(traceback.format_exc())
-            pass
+        except Exception:
+            self.logger.error(" (%s) metadata error", self.target_url, exc_info=True)
         return meta_data
 
+    def run_crawl(self):
+        """
+        this function runs the recursive crawl of the target URL in the crawler thread of start()
+        :return: None
+        """
+        try:
+            self.crawl(self.target_url)
+        except Exception as err:
+            self.crawl_error = err
+        finally:
+            self.seen_urls.close()
+            if self.saved_urls is not None:
+                self.saved_urls.close()
+            if self.recorder is not None:
+                self.recorder.close()
+
     def scrape_url(self, url):
         """
         this function scrape the given URL, extract its features and get all found
@@ -230,229 +1664,271 @@ class WebCrawling:
         :param url: the internal URL to be scrapped
         :return: the non-duplicate found internal urls
         """
+        page_deadline = self.new_page_deadline()
         if self.first_url:
-            resp_redirect = self.check_response_redirecting(url)
+            with self.stage('redirect_check'):
+                resp_redirect = self.check_response_redirecting(url, page_deadline)
             is_redirected = resp_redirect['redirected']
             redirected_url = resp_redirect['redirected_url']
             if is_redirected:
-                logger.info(" ("+str(self.target_url)+") ******* The main url is redirected from "+str(url)+" --> "
-                            + str(redirected_url))
+                self.logger.info(" (%s) ******* The main url is redirected from %s --> %s", self.target_url, url,
+                                 redirected_url, extra={'url': url, 'stage': 'redirect_check'})
                 self.target_url = redirected_url
             self.first_url = False
-            return [redirected_url]
+            if redirected_url is None:
+                return [redirected_url]
+            seed_url = self.canonicalizer.canonicalize(redirected_url) or redirected_url
+            self.seen_urls.add(self.url_key(url))
+            self.seen_urls.add(self.url_key(seed_url))
+            # the seed is already the redirect target, so its first crawl reuses this response instead of a refetch
+            self.seed_redirect = (seed_url, dict(resp_redirect, redirected=False))
+            return [seed_url]
 
         urls = []
-        resp_redirect = self.check_response_redirecting(url)
+        queued_url = url
+        with self.stage('redirect_check'):
+            if self.seed_redirect is not None and self.seed_redirect[0] == url:
+                resp_redirect = self.seed_redirect[1]
+                self.seed_redirect = None
+            else:
+                resp_redirect = self.check_response_redirecting(url, page_deadline)
         is_redirected = resp_redirect['redirected']
         redirected_url = resp_redirect['redirected_url']
+        if page_deadline.expired():
+            return self.page_timed_out(url, 'fetch')
+        if resp_redirect['error'] == 'circuit_open' or is_host_failure(resp_redirect['error'],
+                                                                       resp_redirect['status_code']):
+            self.logger.error(" (%s) skipping %s after %s error", self.target_url, url, resp_redirect['error'],
+                              extra={'url': url, 'stage': 'redirect_check'})
+            try:
+                self.internal_urls.remove(url)
+            except ValueError:
+                pass
+            return []
         if is_redirected:
-            logger.info(" ("+str(self.target_url)+") ******* The url is redirected from " + str(url) + " --> "
-                        + str(redirected_url))
+            self.logger.info(" (%s) ******* The url is redirected from %s --> %s", self.target_url, url,
+                             redirected_url, extra={'url': url, 'stage': 'redirect_check'})
             self.internal_urls = [redirected_url if x == url else x for x in self.internal_urls]
+            self.seen_urls.add(self.url_key(redirected_url))
             url = redirected_url
         if isinstance(url, (bool, int)) or url is None:
             return []
         url_main = url
+        if not is_redirected and redirected_url is not None and \
+                self.canonicalizer.canonicalize(redirected_url) != self.canonicalizer.canonicalize(url):
+            # only the trailing slash differs, the page is saved under the URL the server answered with
+            self.seen_urls.add(self.url_key(redirected_url))
+            url_main = redirected_url
         domain_name = urlparse(self.target_url).netloc
         domain_name_lower = domain_name.lower()
         extracted = tldextract.extract(domain_name)
         extracted_lower = tldextract.extract(domain_name_lower)
 
-        logger.info(" ("+self.target_url+") ------- now crawling  "+str(url))
+        self.logger.info(" (%s) ------- now crawling  %s", self.target_url, url, extra={'url': url})
         if self.href_doc_img_existence(url):
-            logger.warning(" ("+self.target_url+") This is a Document/Image url " + str(url))
+            self.logger.warning(" (%s) This is a Document/Image url %s", self.target_url, url, extra={'url': url})
             try:
                 self.internal_urls.remove(url)
-            except Exception as err:
-                traceback.print_tb(err.__traceback__)
+            except ValueError:
                 pass
             return []
 
         if self.href_external_existence(domain_name, domain_name_lower, extracted, extracted_lower, url):
-            logger.warning(" (" + self.target_url + ") This is an external url " + str(url))
+            self.logger.warning(" (%s) This is an external url %s", self.target_url, url, extra={'url': url})
             try:
                 self.internal_urls.remove(url)
-            except Exception as err:
-                traceback.print_tb(err.__traceback__)
+            except ValueError:
                 pass
             return []
 
         if self.href_doc_img_existence(url):
             return []
 
-        time_req = time.time()
-        html = self.get_html(url)
-        time_response = time.time() - time_req
+        soup = None
+        if resp_redirect['html'] is not None:
+            html = resp_redirect['html']
+            soup = resp_redirect['soup']
+            time_response = resp_redirect['time_response']
+        elif resp_redirect['error'] == 'http':
+            # the server refused the default User-Agent, so only the fallback fetch below is worth trying
+            html = -1
+            time_response = None
+        else:
+            time_req = time.time()
+            with self.stage('fetch'):
+                html = self.get_html(url, page_deadline)
+            time_response = time.time() - time_req
         if html == -1 or len(html) < 1000:
-            logger.error(" ("+self.target_url+") html is not valid/empty for " + str(url))
-            req = Request(url, headers={'User-Agent': '''Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) 
-                                                         AppleWebKit/537.36 (KHTML, like Gecko) 
-                                                         Chrome/39.0.2171.95 Safari/537.36'''})
+            self.logger.error(" (%s) html is not valid/empty for %s", self.target_url, url,
+                              extra={'url': url, 'stage': 'fetch'})
             try:
-                time_req = time.time()
-                html_urllib = urllib.request.urlopen(req, timeout=30).read()
+                with self.stage('fetch'):
+                    html_urllib, fetch_duration = self.fetch(url, timeout=30,
+                                             user_agent='''Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) 
+                                                         AppleWebKit/537.36 (KHTML, like Gecko) 
+                                                         Chrome/39.0.2171.95 Safari/537.36''',
+                                             deadline=page_deadline)[2:]
                 if len(html_urllib) < 1000:
-                    logger.error(" ("+self.target_url+") html1 is N/A for " + str(url))
+                    self.logger.error(" (%s) html1 is N/A for %s", self.target_url, url,
+                                      extra={'url': url, 'stage': 'fetch'})
                     try:
                         self.internal_urls.remove(url)
-                    except Exception as err:
-                        traceback.print_tb(err.__traceback__)
-                        logger.warning(" (" + self.target_url + ") Unable to remove URL from list ")
+                    except ValueError:
                         pass
                     return []
                 else:
                     html = html_urllib
-                    time_response = time.time() - time_req
-            except urllib.error.HTTPError:
-                logger.error(" ("+self.target_url+") HTTP request error for " + str(url))
-                try:
-                    self.internal_urls.remove(url)
-                except Exception as err:
-                    traceback.print_tb(err.__traceback__)
-                    logger.error(" (" + self.target_url + ") Unable to remove URL from list")
-                    pass
-                return []
-            except urllib.error.URLError:
-                logger.error(" ("+self.target_url+") URL request error for " + str(url))
+                    soup = None
+                    time_response = fetch_duration
+            except DeadlineExceeded:
+                return self.page_timed_out(url, 'fetch')
+            except FetchError as err:
+                self.logger.error(" (%s) %s request error for %s", self.target_url, err.error_class, url,
+                                  extra={'url': url, 'stage': 'fetch'})
                 try:
                     self.internal_urls.remove(url)
-                except Exception as err:
-                    traceback.print_tb(err.__traceback__)
-                    logger.error(" (" + self.target_url + ") Unable to remove URL from list")
+                except ValueError:
                     pass
                 return []
-            except Exception as err:
-                traceback.print_tb(err.__traceback__)
-                logger.error(" ("+self.target_url+") UNKNOWN error for " + str(url))
+            except Exception:
+                self.logger.error(" (%s) UNKNOWN error for %s", self.target_url, url, exc_info=True,
+                                  extra={'url': url, 'stage': 'fetch'})
                 try:
                     self.internal_urls.remove(url)
-                except Exception as err:
-                    traceback.print_tb(err.__traceback__)
-                    logger.error(" - (" + self.target_url + ") Unable to remove URL from list")
+                except ValueError:
                     pass
                 return []
+        if page_deadline.expired():
+            return self.page_timed_out(url, 'parse')
         try:
             try:
-                soup = BeautifulSoup(html, features="html.parser")
-            except Exception as err:
-                traceback.print_tb(err.__traceback__)
-                logger.info(" (" + self.target_url + ") html is not valid for " + str(url))
-                logger.error(traceback.format_exc())
+                if soup is None:
+                    with self.stage('parse'):
+                        soup = BeautifulSoup(html, features="html.parser")
+            except Exception:
+                self.logger.error(" (%s) html is not valid for %s", self.target_url, url, exc_info=True,
+                                  extra={'url': url, 'stage': 'parse'})
                 try:
                     self.internal_urls.remove(url)
-                except Exception as err:
-                    traceback.print_tb(err.__traceback__)
-                    logger.error(" (" + self.target_url + ") Unable to remove URL from list")
+                except ValueError:
                     pass
                 return []
 
             if soup.find('title') is not None:
                 if "404" in soup.find('title') or "Not Found" in soup.find('title'):
-                    logger.error(" ("+self.target_url+") page of "+url_main+" returns 404 error.")
+                    self.logger.error(" (%s) page of %s returns 404 error.", self.target_url, url_main,
+                                      extra={'url': url, 'stage': 'parse'})
                     self.internal_urls.remove(url)
                     return []
 
-            p_texts = soup.findAll(text=True)
-            filtered_prev_texts = list(filter(tag_visible, p_texts))
-            cleaned_prev_text = [x for x in filtered_prev_texts if x]
-            prev_text = [x for x in cleaned_prev_text if x != ' ']
-            prev_text = [x for x in prev_text if x != '\n']
-            prev_text_length = len(prev_text)
-            extracted = tldextract.extract(url_main)
-            domain = "{}.{}".format(extracted.domain, extracted.suffix)
-            visuals = get_visual_content(soup)
-            tld = get_url_tld(url_main)
-            tls_ssl_certificate = get_tls_ssl_certificate(url_main)
-            geo_loc = get_geo_loc(url_main)
-            webpage_dict = {
-                '_id': url_main,
-                'url': url_main,
-                'domain_name': domain,
-                'created_time': time.strftime('%Y-%m-%d %H:%M:%S'),
-                'html_char_length': len(html),
-                'text_char_length': sum([len(t) for t in prev_text]),
-                'textual_tags_cnt': prev_text_length,
-                'label': self.label,
-                'label_details': self.label_details,
-                'source': self.source,
-                'geo_loc': geo_loc,
-                'url_length': len(url_main),
-                'domain_length': len(domain),
-                'tld': tld,
-                'protocol': urlparse(url_main).scheme,
-                'time_response': time_response,
-                'tls_ssl_certificate': tls_ssl_certificate,
-                'visual_content_no': len(visuals),
-                'visual_content_src': [link['link'] for link in visuals],
-                'text': prev_text,
-                'html': str(soup),
+            if self.saved_urls is not None and (self.url_key(queued_url) in self.saved_urls or
+                                                self.url_key(url) in self.saved_urls):
+                self.logger.info(" (%s) %s was saved by an earlier run, only following its links", self.target_url,
+                                 url, extra={'url': url, 'stage': 'export'})
+                self.already_saved = self.already_saved + 1
+                try:
+                    self.internal_urls.remove(url)
+                except ValueError:
+                    pass
+                with self.stage('links'):
+                    return self.add_refs(soup, url)
 
-            }
+            features = PageFeatures(self, url_main, html, soup, time_response)
+            with self.stage('features'):
+                webpage_dict = features.to_dict(self.output_fields)
+            if page_deadline.expired():
+                return self.page_timed_out(url, 'export')
 
             try:
-                self.print_export(webpage_dict)
-                self.tld.append(tld)
+                with self.stage('export'):
+                    self.print_export(webpage_dict)
+                if features.is_computed('tld'):
+                    self.tld.append(features.get('tld'))
                 self.time_response.append(time_response)
-                self.tls_ssl_certificate.append(tls_ssl_certificate)
-                self.geo_loc.append(geo_loc)
-                logger.info(" ("+self.target_url+") saving succeeded")
+                self.tls_ssl_certificate.append(features.get('tls_ssl_certificate'))
+                if features.is_computed('geo_loc'):
+                    self.geo_loc.append(features.get('geo_loc'))
+                self.logger.info(" (%s) saving succeeded", self.target_url, extra={'url': url, 'stage': 'export'})
                 self.added_to_db = self.added_to_db + 1
-            except Exception as err:
+                if self.saved_urls is not None:
+                    self.saved_urls.add(self.url_key(queued_url))
+                    self.saved_urls.add(self.url_key(url))
+            except Exception:
                 del webpage_dict
-                del p_texts
-                del filtered_prev_texts
-                del cleaned_prev_text
-                del prev_text
-                del prev_text_length
+                del features
                 del html
                 del soup
                 del is_redirected
                 del redirected_url
-                traceback.print_tb(err.__traceback__)
-                logger.error(" ("+self.target_url+") saving error")
-                logger.error(traceback.format_exc())
+                self.logger.error(" (%s) saving error", self.target_url, exc_info=True,
+                                  extra={'url': url, 'stage': 'export'})
                 return False, {
                     'url': url_main,
                     'status': 'unsuccessful',
                     'details': "Saving Error - traceback: " + traceback.format_exc()
                 }
-            urls = self.add_refs(soup, url)
+            with self.stage('links'):
+                urls = self.add_refs(soup, url)
             del soup
             del webpage_dict
-            del p_texts
-            del filtered_prev_texts
-            del cleaned_prev_text
-            del prev_text
-            del prev_text_length
+            del features
             del html
             del is_redirected
             del redirected_url
         except requests.exceptions.ConnectionError:
-            logger.error(" ("+self.target_url+") ERROR - Connection refused")
+            self.logger.error(" (%s) ERROR - Connection refused", self.target_url, extra={'url': url})
 
         return urls
 
+    def url_key(self, url):
+        """
+        :param url: an absolute URL
+        :return: the key of the URL in the seen-URL sets
+        """
+        return self.canonicalizer.seen_key(self.canonicalizer.canonicalize(url) or url)
+
+    def stage(self, name):
+        """
+        :param name: the name of the pipeline stage
+        :return: a context manager measuring the stage for the profiler, if profiling is enabled
+        """
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.stage(self.site, name)
+
+    def new_page_deadline(self):
+        """
+        :return: the deadline of scraping a single webpage, bounded by the deadline of the target URL
+        """
+        if self.page_time_out is None:
+            return self.deadline
+        return Deadline(time.time() + self.page_time_out, parent=self.deadline)
+
+    def page_timed_out(self, url, stage):
+        """
+        this function drops a webpage whose deadline expired before its scraping finished from the crawled internal
+        URLs
+        :param url: the URL of the webpage
+        :param stage: the pipeline stage at which the deadline was noticed ('fetch', 'parse' or 'export')
+        :return: an empty list of found internal URLs
+        """
+        if self.deadline.expired():
+            self.timed_out = True
+        self.logger.warning(" (%s) deadline expired during %s of %s", self.target_url, stage, url,
+                            extra={'url': url, 'stage': stage})
+        try:
+            self.internal_urls.remove(url)
+        except ValueError:
+            pass
+        return []
+
     def href_doc_img_existence(self, href):
         """
         this function will check whether the provided url is image, document, executable, or webpage URL
         :param href: the internal found url
         :return: True if not webpage URL, False if it is
         """
-        for ext in self.extensions_img:
-            if href.endswith('.'+ext.lower()) or href.endswith('.'+ext):
-                return True
-
-        for ext in self.extensions:
-            if href.endswith('.'+ext.lower()) or href.endswith('.'+ext):
-                return True
-
-        if href.endswith('.msi') or href.endswith('.exe') or href.endswith('.jar') or href.endswith(
-                '.zip') or href.endswith('.deb') or href.endswith('.tar.gz'):
-            return True
-
-        if href.endswith('.pdf') or href.endswith('.ppsx'):
-            return True
-        return False
+        return self.canonicalizer.is_skipped(href)
 
     def print_export(self, dict_save):
         """
@@ -460,17 +1936,16 @@ class WebCrawling:
         :param dict_save: the dictionary of the information if a webpage
         :return: None
         """
-        logger.info("[+] (" + self.target_url + ") --- Saved pages are : " + str(self.added_to_db))
+        self.logger.info("[+] (%s) --- Saved pages are : %d", self.target_url, self.added_to_db)
         try:
             valid_file_name = get_valid_url_name(dict_save['url'])
             if check_file(self.file_n) == -1:
                 return
             with open(self.file_n + valid_file_name + ".json", 'w') as f:
                 json.dump(dict_save, f)
-        except Exception as err:
-            traceback.print_tb(err.__traceback__)
-            logger.error(" (" + self.target_url + ") saving error")
-            logger.error(traceback.format_exc())
+        except Exception:
+            self.logger.error(" (%s) saving error", self.target_url, exc_info=True,
+                              extra={'url': dict_save.get('url'), 'stage': 'export'})
 
     def add_refs(self, soup, url):
         """
@@ -489,36 +1964,24 @@ class WebCrawling:
                 href = a_tag.attrs.get("href")
                 if href == "" or href is None:
                     continue
-                href = urljoin(url, href)
-                parsed_href = urlparse(href)
-                href = parsed_href.scheme + '://' + parsed_href.netloc + parsed_href.path
-                if not is_valid(href):
-                    continue
-                if self.href_external_existence(domain_name, domain_name_lower, extracted, extracted_lower, href):
+                href = self.canonicalizer.canonicalize(urljoin(url, href))
+                if href is None or not is_valid(href):
                     continue
-                if self.href_internal_existence(href):
+                if urlparse(href).scheme not in DEFAULT_PORTS:
                     continue
-                if self.href_internal_existence(href):
+                if self.href_doc_img_existence(href):
                     continue
                 if self.href_external_existence(domain_name, domain_name_lower, extracted, extracted_lower, href):
                     continue
+                if not self.seen_urls.add(self.canonicalizer.seen_key(href)):
+                    continue
                 urls.append(href)
                 self.internal_urls.append(href)
             else:
-                logger.warning(" ("+self.target_url+") : Reached max_crawling_links.")
+                self.logger.warning(" (%s) : Reached max_crawling_links.", self.target_url, extra={'stage': 'links'})
                 break
         return urls
 
-    def href_internal_existence(self, href):
-        """
-        this function checks if the given URL already has been found for the target URL
-        :param href: the URL to be checked
-        :return: True if the given URL has been found already, if not False
-        """
-        if href in self.internal_urls:
-            return True
-        return False
-
     def href_external_existence(self, domain_name, domain_name_lower, extracted, extracted_lower, href):
         """
         this function checks if the given URL does not belong to the same website of the target URL
@@ -531,14 +1994,6 @@ class WebCrawling:
         """
         if domain_name not in href and domain_name_lower not in href and extracted.domain not in href \
                 and extracted_lower.domain not in href:
-            if href not in self.external_urls:
-                self.external_urls.append(href)
-            if urlparse(href).path == '/':
-                unique_domain = href
-            else:
-                unique_domain = href.replace(urlparse(href).path, '')
-            if unique_domain not in self.external_unique_domains:
-                self.external_unique_domains.append(unique_domain)
             return True
         else:
             return False
@@ -550,53 +2005,77 @@ class WebCrawling:
         :return: None
         """
         crawled_cnt = 0
-        if time.time() - self.ts > self.crawl_time_out:
-            logger.warning(" (" + self.target_url + ") : Time out (processing time is exceeded the time out of " +
-                           str(self.crawl_time_out)+" seconds)")
+        if self.deadline.expired():
+            self.timed_out = True
+            self.logger.warning(" (%s) : Time out (processing time is exceeded the time out of %s seconds)",
+                                self.target_url, self.crawl_time_out)
             return
         else:
             self.crawled_number = self.crawled_number + 1
-            links = self.scrape_url(url)
+            with self.stage('page'):
+                links = self.scrape_url(url)
+            if not links or self.deadline.expired():
+                return
             with pool.ThreadPool(multiprocessing.cpu_count()) as p_crawl:
                 results_crawler = p_crawl.map(self.crawl, links)
                 for i in range(len(results_crawler)):
                     crawled_cnt = crawled_cnt + 1
 
-    def check_response_redirecting(self, url):
+    def check_response_redirecting(self, url, deadline=None):
         """
         this function check redirecting url
         :param url: the given url to be checked
+        :param deadline: the deadline of the fetch, by default the deadline of the target URL
         :return: dictionary contain:
         redirected: False if the given URL is redirect to another URL, or True if not
         redirected_url: the url in case of redirection
+        html: the fetched html source of the url, so it is not downloaded a second time, None on failure
+        soup: the Beautifulsoup object of the html source, so it is not parsed a second time, None on failure
+        time_response: the response time of the fetch in seconds, None on failure
+        error: the class of the fetch failure, None on success
+        status_code: the HTTP status code of the fetch failure, if any
         """
+        result = {'redirected': None, 'redirected_url': url, 'html': None, 'soup': None, 'time_response': None,
+                  'error': None, 'status_code': None}
         try:
-            req = Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-            urllib_response = urllib.request.urlopen(req, timeout=15)
-            html_urllib = urllib.request.urlopen(req, timeout=15).read()
-            code = urllib_response.getcode()
+            request_url = urllib.parse.quote(url, safe=string.printable)
+            with self.stage('fetch'):
+                response_url, code, html_urllib, time_response = self.fetch(request_url, timeout=15,
+                                                                            deadline=deadline)
             if not code == 200:
-                logger.error(" ("+self.target_url+") Error requests for "+url+" (status_code: " + code + ").")
-                return {'redirected': False, 'redirected_url': None}  # -1, -1, -1
-            soup = BeautifulSoup(html_urllib, features="html.parser")
+                self.logger.error(" (%s) Error requests for %s (status_code: %s).", self.target_url, url, code,
+                                  extra={'url': url, 'stage': 'redirect_check'})
+                result.update({'redirected': False, 'redirected_url': None})
+                return result
+            with self.stage('parse'):
+                soup = BeautifulSoup(html_urllib, features="html.parser")
             if soup.find('title') is not None:
                 if "404" in soup.find('title') or "Not Found" in soup.find('title'):
-                    logger.error(" ("+self.target_url+") Error requests 404 for "+url)
-                    return {'redirected': False, 'redirected_url': None}  # -1, -1, -1
-            if not urllib_response.url == url:
-                if urllib_response.url.replace(' ', '') == url + "/" or urllib_response.url.replace(' ',
-                                                                                                    '') + "/" == url:
-                    return {'redirected': False, 'redirected_url': urllib_response.url}  # False, urllib_response.url, html_urllib
+                    self.logger.error(" (%s) Error requests 404 for %s", self.target_url, url,
+                                      extra={'url': url, 'stage': 'redirect_check'})
+                    result.update({'redirected': False, 'redirected_url': None})
+                    return result
+            if not response_url == request_url:
+                if (self.canonicalizer.canonicalize(response_url.replace(' ', '')) or '').rstrip('/') == \
+                        (self.canonicalizer.canonicalize(request_url) or '').rstrip('/'):
+                    result.update({'redirected': False, 'redirected_url': response_url})
                 else:
-                    logger.warning(" (" + self.target_url + ") : Redirected link (" + url + ") to " +
-                                   urllib_response.url)
-                    return {'redirected': True, 'redirected_url': urllib_response.url}  # True, urllib_response.url, -1
-            return {'redirected': False, 'redirected_url': urllib_response.url}  # False, urllib_response.url, html_urllib
-        except Exception as err:
-            traceback.print_tb(err.__traceback__)
-            logger.error(" (" + self.target_url + ") checking URL redirection error")
-            logger.error(" (" + self.target_url + traceback.format_exc())
-            return {'redirected': None, 'redirected_url': url}  # -1, url, -1
+                    self.logger.warning(" (%s) : Redirected link (%s) to %s", self.target_url, url, response_url,
+                                        extra={'url': url, 'stage': 'redirect_check'})
+                    result.update({'redirected': True, 'redirected_url': response_url})
+            else:
+                result.update({'redirected': False, 'redirected_url': response_url})
+            result.update({'html': html_urllib, 'soup': soup, 'time_response': time_response})
+            return result
+        except FetchError as err:
+            self.logger.error(" (%s) checking URL redirection error: %s", self.target_url, err,
+                              extra={'url': url, 'stage': 'redirect_check'})
+            result.update({'error': err.error_class, 'status_code': err.status_code})
+            return result
+        except Exception:
+            self.logger.error(" (%s) checking URL redirection error", self.target_url, exc_info=True,
+                              extra={'url': url, 'stage': 'redirect_check'})
+            return result
 
     def check_link_response(self, link):
         """
@@ -607,13 +2086,12 @@ class WebCrawling:
         try:
             req_link_resp = requests.get(link)
             if not req_link_resp.status_code == 200:
-                logger.error(" ("+self.target_url+") Error requests 404 for "+link+" (status_code: "
-                             + str(req_link_resp.status_code)+").")
+                self.logger.error(" (%s) Error requests 404 for %s (status_code: %s).", self.target_url, link,
+                                  req_link_resp.status_code, extra={'url': link})
                 return False
-        except Exception as err:
-            traceback.print_tb(err.__traceback__)
-            logger.error(" (" + self.target_url + ") checking URL response error")
-            logger.error(" (" + self.target_url + traceback.format_exc())
+        except Exception:
+            self.logger.error(" (%s) checking URL response error", self.target_url, exc_info=True,
+                              extra={'url': link})
             return False
         try:
             req = Request(link, headers={'User-Agent': 'Mozilla/5.0'})
@@ -621,32 +2099,184 @@ class WebCrawling:
             soup = BeautifulSoup(html_urllib, features="html.parser")
             if soup.find('title') is not None:
                 if "404" in soup.find('title') or "Not Found" in soup.find('title'):
-                    logger.error(" ("+self.target_url+") Error requests 404 for "+link)
+                    self.logger.error(" (%s) Error requests 404 for %s", self.target_url, link, extra={'url': link})
                     return False
-        except Exception as err:
-            traceback.print_tb(err.__traceback__)
-            logger.error(" (" + self.target_url + ") General error requests for "+link)
-            logger.error(" (" + self.target_url + traceback.format_exc())
+        except Exception:
+            self.logger.error(" (%s) General error requests for %s", self.target_url, link, exc_info=True,
+                              extra={'url': link})
             return False
         return True
 
-    def get_html(self, url_target):
+    def get_html(self, url_target, deadline=None):
         """
         this function gets the html source of a webpage
         :param url_target: given URL
+        :param deadline: the deadline of the fetch, by default the deadline of the target URL
         :return: the html source of the given URL
         """
         url = urllib.parse.quote(url_target, safe=string.printable)
-        req = Request(url, headers={'User-Agent': 'Mozilla/5.0'})
         try:
-            html = urllib.request.urlopen(req, timeout=60).read()
-        except Exception as err:
-            traceback.print_tb(err.__traceback__)
-            logger.error(" (" + self.target_url + ") error getting HTML for "+url_target)
-            logger.error(" (" + self.target_url + traceback.format_exc())
+            html = self.fetch(url, timeout=60, deadline=deadline)[2]
+        except FetchError as err:
+            self.logger.error(" (%s) error getting HTML for %s: %s", self.target_url, url_target, err,
+                              extra={'url': url_target, 'stage': 'fetch'})
+            return -1
+        except Exception:
+            self.logger.error(" (%s) error getting HTML for %s", self.target_url, url_target, exc_info=True,
+                              extra={'url': url_target, 'stage': 'fetch'})
             return -1
         return html
 
+    def fetch(self, url, timeout, user_agent='Mozilla/5.0', deadline=None):
+        """
+        this function fetches the given URL through the per-host circuit breaker, retrying transient failures
+        with jittered exponential backoff
+        :param url: the URL to be fetched
+        :param timeout: the socket timeout of each attempt in seconds, shortened to the remaining deadline
+        :param user_agent: the User-Agent header sent with the request
+        :param deadline: the deadline of the fetch, by default the deadline of the target URL
+        :return: tuple of the final URL after redirects, the HTTP status code, the response body and the duration of
+        the successful attempt in seconds
+        :raises DeadlineExceeded: if the deadline expired before or while fetching
+        :raises CircuitOpenError: if the circuit of the URL host is open
+        :raises FetchError: if the URL could not be fetched after all retries
+        """
+        if self.archive is not None:
+            try:
+                return self.archive.replay(url)
+            except FetchError as err:
+                self.record_fetch_error(err.error_class, err.status_code)
+                raise
+        deadline = self.deadline if deadline is None else deadline
+        host = urlparse(url).netloc.lower()
+        attempt = 0
+        while True:
+            if deadline.expired():
+                raise DeadlineExceeded(url)
+            if not self.circuit_breaker.allow_request(host):
+                self.record_fetch_error('circuit_open')
+                raise CircuitOpenError(url)
+            if attempt == 0:
+                self.circuit_breaker.record_request(host)
+            req = Request(url, headers={'User-Agent': user_agent})
+            time_req = time.time()
+            try:
+                with urllib.request.urlopen(req, timeout=deadline.cap(timeout)) as response:
+                    with self.in_flight_lock:
+                        self.in_flight.add(response)
+                    try:
+                        chunks = []
+                        chunk = response.read(65536)
+                        while chunk:
+                            if deadline.expired():
+                                raise DeadlineExceeded(url)
+                            chunks.append(chunk)
+                            chunk = response.read(65536)
+                        body = b''.join(chunks)
+                    finally:
+                        with self.in_flight_lock:
+                            self.in_flight.discard(response)
+                    final_url = response.url
+                    code = response.getcode()
+                    duration = time.time() - time_req
+                    if self.recorder is not None:
+                        self.recorder.write_response(url, final_url, code, response.headers, body, duration)
+            except Exception as err:
+                if deadline.expired():
+                    raise DeadlineExceeded(url) from err
+                error_class = classify_fetch_error(err)
+                status_code = err.code if isinstance(err, urllib.error.HTTPError) else None
+                self.record_fetch_error(error_class, status_code)
+                if is_host_failure(error_class, status_code):
+                    self.circuit_breaker.record_failure(host)
+                else:
+                    self.circuit_breaker.record_success(host)
+                retry_after = None
+                if status_code in (429, 503):
+                    retry_after = parse_retry_after(err.headers.get('Retry-After'))
+                retryable = attempt < self.max_retries and is_retryable_error(error_class, status_code)
+                if retryable and retry_after is not None and retry_after > self.backoff_max:
+                    self.logger.warning(" (%s) %s asks to retry %s in %.0fs, more than backoff_max", self.target_url,
+                                        host, url, retry_after, extra={'url': url, 'stage': 'fetch'})
+                    retryable = False
+                if retryable and not self.circuit_breaker.allow_retry(host):
+                    self.logger.warning(" (%s) retry budget of %s exhausted, not retrying %s", self.target_url, host,
+                                        url, extra={'url': url, 'stage': 'fetch'})
+                    retryable = False
+                if not retryable:
+                    if self.recorder is not None:
+                        self.record_failure(url, err, error_class, time.time() - time_req)
+                    raise FetchError(url, error_class, status_code) from err
+                attempt = attempt + 1
+                delay = self.backoff_delay(attempt) if retry_after is None else retry_after
+                self.logger.warning(" (%s) %s error for %s, retry %d/%d in %.2fs", self.target_url, error_class, url,
+                                    attempt, self.max_retries, delay, extra={'url': url, 'stage': 'fetch'})
+                deadline.wait(delay)
+                continue
+            self.circuit_breaker.record_success(host)
+            return final_url, code, body, duration
+
+    def record_failure(self, url, err, error_class, duration):
+        """
+        this function records a failed fetch into the archive, with its response if the server answered
+        :param url: the requested URL
+        :param err: the exception raised by the fetch
+        :param error_class: the class of the fetch failure
+        :param duration: the fetch duration in seconds
+        :return: None
+        """
+        if isinstance(err, urllib.error.HTTPError):
+            try:
+                body = err.read()
+            except Exception:
+                body = b''
+            self.recorder.write_response(url, err.url or url, err.code, err.headers, body, duration)
+        else:
+            self.recorder.write_error(url, error_class)
+
+    def lookup_geo_loc(self, url):
+        """
+        :param url: the target URL
+        :return: the IP geographical location of the target URL, read from the archive in replay mode
+        """
+        if self.archive is not None:
+            return self.archive.get_metadata(url, 'geo_loc')
+        geo_loc = get_geo_loc(url)
+        if self.recorder is not None:
+            self.recorder.write_metadata(url, {'geo_loc': geo_loc})
+        return geo_loc
+
+    def cancel_in_flight(self):
+        """
+        this function aborts the responses still being downloaded, so their fetching threads stop promptly
+        :return: None
+        """
+        with self.in_flight_lock:
+            responses = list(self.in_flight)
+        for response in responses:
+            try:
+                response.fp.raw._sock.shutdown(socket.SHUT_RDWR)
+            except Exception:
+                pass
+
+    def backoff_delay(self, attempt):
+        """
+        :param attempt: the number of the retry, starting from 1
+        :return: the full-jitter exponential backoff delay in seconds before the given retry
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def record_fetch_error(self, error_class, status_code=None):
+        """
+        this function counts a fetch failure by its class for the metadata of the target URL
+        :param error_class: the class of the fetch failure
+        :param status_code: the HTTP status code of the failure, if any
+        :return: None
+        """
+        key = error_class if status_code is None else error_class + '_' + str(status_code)
+        with self.fetch_errors_lock:
+            self.fetch_errors[key] = self.fetch_errors.get(key, 0) + 1
+
 
 def tag_visible(element):
     """
@@ -691,7 +2321,7 @@ def check_file(file):
     """
     try:
         if not os.path.exists(os.path.dirname(file)):
-            logger.warning("Path not found " + file)
+            logger.warning("Path not found %s", file)
             try:
                 os.makedirs(os.path.dirname(file))
                 logger.info("Path created")
@@ -701,10 +2331,8 @@ def check_file(file):
                     raise
             return False
         return True
-    except Exception as err:
-        traceback.print_tb(err.__traceback__)
-        logger.error("Error file check for " + file)
-        logger.error(traceback.format_exc())
+    except Exception:
+        logger.error("Error file check for %s", file, exc_info=True)
         return -1
 
 
@@ -713,7 +2341,13 @@ class InitiateProject:
     this is a helper class acts as an interface for WebCrawling class
     """
     def __init__(self, domains, saving_directory='Crawled Dataset/', max_crawling_number=250,
-                 collection_source=None, label=None, sub_label=None, crawl_time_out=7200):
+                 collection_source=None, label=None, sub_label=None, crawl_time_out=7200, max_retries=2,
+                 backoff_base=1, backoff_max=30, breaker_threshold=5, breaker_reset_timeout=300,
+                 retry_budget_ratio=0.2, retry_budget_window=60, output_fields=None,
+                 page_time_out=None, run_time_out=None, seen_urls_file=None, seen_urls_capacity=1000000,
+                 seen_urls_error_rate=0.001, profile=None, profile_allocations=None, archive_directory=None,
+                 archive_mode=None, replay_processes=None, keep_query_params=None, strip_query_params=None,
+                 skip_url_patterns=None, remove_index_pages=True, trailing_slash='keep'):
         """
         :param domains: a list of the target URLs to be crawled
         :type domains: list
@@ -729,6 +2363,67 @@ class InitiateProject:
         :type sub_label: str
         :param crawl_time_out: the limit of crawling the target URL in seconds
         :type crawl_time_out: int
+        :param max_retries: the number of retries of a transient fetch failure (timeout, connection, HTTP 429/5xx)
+        :type max_retries: int
+        :param backoff_base: the base delay in seconds of the jittered exponential backoff between retries
+        :type backoff_base: float
+        :param backoff_max: the maximum delay in seconds between retries
+        :type backoff_max: float
+        :param breaker_threshold: the number of consecutive failures of a host before failing its remaining URLs fast
+        :type breaker_threshold: int
+        :param breaker_reset_timeout: the number of seconds before an open host circuit is probed again
+        :type breaker_reset_timeout: int
+        :param retry_budget_ratio: the number of retries allowed per request sent to a host within the retry budget
+        window, bounding the retries of hosts that fail intermittently
+        :type retry_budget_ratio: float
+        :param retry_budget_window: the length in seconds of the window of the retry budget of each host
+        :type retry_budget_window: float
+        :param output_fields: the fields saved for each webpage, a profile name of OUTPUT_PROFILES ('links-only',
+        'text', 'full') or a list of OUTPUT_FIELDS, by default 'full'
+        :type output_fields: str or list
+        :param page_time_out: the limit of fetching, parsing and saving a single webpage in seconds, if any
+        :type page_time_out: int
+        :param run_time_out: the limit of the whole crawling run of all target URLs in seconds, if any
+        :type run_time_out: int
+        :param seen_urls_file: the file of a filter of the saved URLs, shared by all target URLs and worker processes
+        and kept for incremental recrawls, a URL is added once its webpage is saved, later runs still follow its links
+        but do not save it again, if any (the in-run deduplication always uses an in-memory seen set per target URL)
+        :type seen_urls_file: str
+        :param seen_urls_capacity: the number of URLs the seen-URL filters are sized for
+        :type seen_urls_capacity: int
+        :param seen_urls_error_rate: the false-positive rate of the seen-URL filters
+        :type seen_urls_error_rate: float
+        :param profile: the profiling mode of the run, 'deterministic' or 'sampling', if any; the results are saved
+        to the saving directory
+        :type profile: str
+        :param profile_allocations: whether the top allocation sites are traced with tracemalloc while profiling, by
+        default only in deterministic mode
+        :type profile_allocations: bool
+        :param archive_directory: the directory of the WARC files of the raw responses, one file per target URL,
+        required by archive_mode
+        :type archive_directory: str
+        :param archive_mode: 'record' to record every fetch into archive_directory, or 'replay' to re-scrape the
+        target URLs from archive_directory without network, if any; unlike crawling, replay does not skip the target
+        URLs already saved in saving_directory and overwrites their files, so pass another saving_directory to keep
+        the recorded results
+        :type archive_mode: str
+        :param replay_processes: the number of worker processes replaying archive files in parallel, by default the
+        number of CPUs (replay runs in threads when profiling)
+        :type replay_processes: int
+        :param keep_query_params: the wildcard patterns of the query parameters kept in the found URLs, None to keep
+        every parameter that is not stripped, an empty list to drop the whole query
+        :type keep_query_params: list
+        :param strip_query_params: the wildcard patterns of the query parameters dropped from the found URLs, by
+        default STRIPPED_QUERY_PARAMS (tracking and session parameters)
+        :type strip_query_params: list
+        :param skip_url_patterns: regular expressions of found URLs that are not crawled, in addition to the
+        document/image extensions, if any
+        :type skip_url_patterns: list
+        :param remove_index_pages: whether the index pages ('index.html', ...) of the found URLs are replaced by their
+        directory
+        :type remove_index_pages: bool
+        :param trailing_slash: 'keep' to leave the trailing slash of the found URLs as linked, or 'strip' to remove it
+        :type trailing_slash: str
 
         """
         self.domains = domains
@@ -738,11 +2433,59 @@ class InitiateProject:
         self.max_crawling_number = max_crawling_number
         self.collection_source = collection_source
         self.crawl_time_out = crawl_time_out
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset_timeout = breaker_reset_timeout
+        self.retry_budget_ratio = retry_budget_ratio
+        self.retry_budget_window = retry_budget_window
+        self.output_fields = resolve_output_fields(output_fields)
+        self.page_time_out = page_time_out
+        self.run_deadline = Deadline(None if run_time_out is None else time.time() + run_time_out)
+        self.seen_urls_file = seen_urls_file
+        self.seen_urls_capacity = seen_urls_capacity
+        self.seen_urls_error_rate = seen_urls_error_rate
+        self.archive_directory = archive_directory
+        self.archive_mode = archive_mode
+        self.keep_query_params = keep_query_params
+        self.strip_query_params = strip_query_params
+        self.skip_url_patterns = skip_url_patterns
+        self.remove_index_pages = remove_index_pages
+        self.trailing_slash = trailing_slash
+        if archive_mode not in (None, 'record', 'replay'):
+            raise ValueError("Unknown archive mode '" + str(archive_mode) + "', expected 'record' or 'replay'")
+        if archive_mode is not None and archive_directory is None:
+            raise ValueError("The archive mode '" + archive_mode + "' needs an archive_directory")
+        # the URL options are checked once here, before any directory of a target URL is created
+        UrlCanonicalizer(keep_query_params, strip_query_params, skip_patterns=skip_url_patterns,
+                         remove_index_pages=remove_index_pages, trailing_slash=trailing_slash)
+        self.profiler = None
+        if profile is not None:
+            self.profiler = CrawlProfiler(profile, self.main_file_n, trace_allocations=profile_allocations)
+            self.profiler.start()
         self.full_ds = self.prepare_dataset()
-        with pool.ThreadPool(multiprocessing.cpu_count() * 2) as p:
-            results = p.map(self.start_crawling, self.full_ds)
+        try:
+            if archive_mode == 'replay' and self.profiler is None:
+                worker_logging, worker_listener = start_worker_logging()
+                try:
+                    with multiprocessing.Pool(replay_processes or multiprocessing.cpu_count(),
+                                              initializer=init_worker_logging, initargs=(worker_logging,)) as p:
+                        results = p.map(start_crawling_task, self.full_ds)
+                        # the workers exit normally, so their queued records are flushed before the listener stops
+                        p.close()
+                        p.join()
+                finally:
+                    if worker_listener is not None:
+                        worker_listener.stop()
+            else:
+                with pool.ThreadPool(multiprocessing.cpu_count() * 2) as p:
+                    results = p.map(self.start_crawling, self.full_ds)
             for r in results:
-                logger.info("Returned " + str(r))
+                logger.info("Returned %s", r)
+        finally:
+            if self.profiler is not None:
+                self.profiler.stop()
 
     def start_crawling(self, ds):
         """
@@ -750,29 +2493,7 @@ class InitiateProject:
         :param ds: a dictionary contains the initial parameters of this class
         :return: status of running WebCrawling object
         """
-        if check_file(ds['file_n']):
-            logger.info("The website " + ds['dataset'] + " already crawled (" + ds['file_n'] + ")")
-            return
-        elif check_file(ds['file_n']) == -1:
-            return
-        web_crawler = WebCrawling(
-            url=ds['dataset'],
-            file_n=ds['file_n'],
-            label=ds['label'],
-            label_details=ds['label_details'],
-            max_crawling=ds['max_crawling_number'],
-            collection_source=ds['collection_source'],
-            crawl_time_out=ds['crawl_time_out']
-        )
-        meta_data = web_crawler.start()
-        with open(ds['file_n'] + "Metadata.json", 'w') as f:
-            json.dump(meta_data, f)
-        ts = time.time()
-        time_now = datetime.utcfromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
-        time_now = time_now.replace(':', '-')
-        if meta_data is not None:
-            return 'Done -' + str(meta_data['crawling_status']) + ' ... ' + str(ds['dataset']) + ' (' + time_now + ')'
-        return 'Done - Unsuccessfully ... ' + str(ds['dataset']) + ' (' + time_now + ')'
+        return start_crawling_task(ds, self.profiler)
 
     def prepare_dataset(self):
         """
@@ -790,6 +2511,9 @@ class InitiateProject:
             else:
                 website = "https://" + d
             file_n = self.main_file_n + get_valid_url_name(website) + '/'
+            archive_file = None
+            if self.archive_directory is not None:
+                archive_file = self.archive_directory + get_valid_url_name(website) + '.warc.gz'
             dataset.append(
                 {
                     'dataset': website,
@@ -798,9 +2522,93 @@ class InitiateProject:
                     'label_details': self.sub_label,
                     'max_crawling_number': self.max_crawling_number,
                     'collection_source': self.collection_source,
-                    'crawl_time_out': self.crawl_time_out
+                    'crawl_time_out': self.crawl_time_out,
+                    'max_retries': self.max_retries,
+                    'backoff_base': self.backoff_base,
+                    'backoff_max': self.backoff_max,
+                    'breaker_threshold': self.breaker_threshold,
+                    'breaker_reset_timeout': self.breaker_reset_timeout,
+                    'retry_budget_ratio': self.retry_budget_ratio,
+                    'retry_budget_window': self.retry_budget_window,
+                    'output_fields': self.output_fields,
+                    'page_time_out': self.page_time_out,
+                    'run_deadline': self.run_deadline.expires_at,
+                    'seen_urls_file': self.seen_urls_file,
+                    'seen_urls_capacity': self.seen_urls_capacity,
+                    'seen_urls_error_rate': self.seen_urls_error_rate,
+                    'archive_file': archive_file,
+                    'archive_mode': self.archive_mode,
+                    'keep_query_params': self.keep_query_params,
+                    'strip_query_params': self.strip_query_params,
+                    'skip_url_patterns': self.skip_url_patterns,
+                    'remove_index_pages': self.remove_index_pages,
+                    'trailing_slash': self.trailing_slash
                 }
             )
         return dataset
 
 
+def start_crawling_task(ds, profiler=None):
+    """
+    this function starts the WebCrawling object of the given task, it is a module-level function so replay tasks
+    can run in worker processes
+    :param ds: a dictionary contains the initial parameters of InitiateProject for the target URL
+    :param profiler: the profiler of the crawling run, if any
+    :return: status of running WebCrawling object
+    """
+    if ds['run_deadline'] is not None and time.time() >= ds['run_deadline']:
+        logger.warning("The website %s is skipped, the run time out is exceeded", ds['dataset'],
+                       extra={'site': ds['dataset']})
+        return 'Skipped - timed_out ... ' + str(ds['dataset'])
+    if ds['archive_mode'] == 'replay' and not os.path.exists(ds['archive_file']):
+        logger.warning("The website %s has no archive (%s)", ds['dataset'], ds['archive_file'],
+                       extra={'site': ds['dataset']})
+        return 'Skipped - not archived ... ' + str(ds['dataset'])
+    file_exists = check_file(ds['file_n'])
+    if file_exists == -1:
+        return
+    elif file_exists and ds['archive_mode'] == 'replay':
+        logger.warning("The website %s is replayed into its existing directory (%s), its saved files are overwritten",
+                       ds['dataset'], ds['file_n'], extra={'site': ds['dataset']})
+    elif file_exists:
+        logger.info("The website %s already crawled (%s)", ds['dataset'], ds['file_n'], extra={'site': ds['dataset']})
+        return
+    web_crawler = WebCrawling(
+        url=ds['dataset'],
+        file_n=ds['file_n'],
+        label=ds['label'],
+        label_details=ds['label_details'],
+        max_crawling=ds['max_crawling_number'],
+        collection_source=ds['collection_source'],
+        crawl_time_out=ds['crawl_time_out'],
+        max_retries=ds['max_retries'],
+        backoff_base=ds['backoff_base'],
+        backoff_max=ds['backoff_max'],
+        breaker_threshold=ds['breaker_threshold'],
+        breaker_reset_timeout=ds['breaker_reset_timeout'],
+        retry_budget_ratio=ds['retry_budget_ratio'],
+        retry_budget_window=ds['retry_budget_window'],
+        output_fields=ds['output_fields'],
+        page_time_out=ds['page_time_out'],
+        run_deadline=ds['run_deadline'],
+        seen_urls_file=ds['seen_urls_file'],
+        seen_urls_capacity=ds['seen_urls_capacity'],
+        seen_urls_error_rate=ds['seen_urls_error_rate'],
+        profiler=profiler,
+        archive_file=ds['archive_file'],
+        archive_mode=ds['archive_mode'],
+        keep_query_params=ds['keep_query_params'],
+        strip_query_params=ds['strip_query_params'],
+        skip_url_patterns=ds['skip_url_patterns'],
+        remove_index_pages=ds['remove_index_pages'],
+        trailing_slash=ds['trailing_slash']
+    )
+    meta_data = web_crawler.start()
+    with open(ds['file_n'] + "Metadata.json", 'w') as f:
+        json.dump(meta_data, f)
+    ts = time.time()
+    time_now = datetime.utcfromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+    time_now = time_now.replace(':', '-')
+    if meta_data is not None:
+        return 'Done -' + str(meta_data['crawling_status']) + ' ... ' + str(ds['dataset']) + ' (' + time_now + ')'
+    return 'Done - Unsuccessfully ... ' + str(ds['dataset']) + ' (' + time_now + ')'
@@ -0,0 +1,129 @@
+import argparse
+import statistics
+import tempfile
+import time
+import CrawlScrape
+from CrawlScrape import WebCrawling, WarcArchive, OUTPUT_PROFILES
+
+
+def synthetic_page(paragraphs=400):
+    """
+    :param paragraphs: the number of text blocks in the page
+    :return: html source of a synthetic webpage with text, links and visual content
+    """
+    body = []
+    for i in range(paragraphs):
+        body.append('<div><p>Paragraph ' + str(i) + ' with <span>some visible text</span> and '
+                    '<a href="/page-' + str(i) + '">a link</a></p><img src="/img-' + str(i) + '.png">'
+                    '<script>var x = ' + str(i) + ';</script><!-- comment ' + str(i) + ' --></div>')
+    return ('<html><head><title>Benchmark page</title></head><body>' + ''.join(body) +
+            '</body></html>').encode()
+
+
+def archive_pages(path):
+    """
+    :param path: a WARC file recorded with archive_mode='record'
+    :return: list of (url, html) of the successful responses of the archive, an offline reproducible corpus
+    """
+    archive = WarcArchive(path)
+    return [(url, response[2]) for url, response in archive.responses.items()
+            if not isinstance(response, str) and response[1] == 200]
+
+
+def offline_geo_loc(url):
+    """
+    :param url: the target URL
+    :return: a fixed geographical location, so the 'full' profile does not measure the geolocation service
+    """
+    return 'Benchmark'
+
+
+def offline_fetch(corpus):
+    """
+    :param corpus: list of (url, html) of the pages
+    :return: a replacement of WebCrawling.fetch serving the pages of the corpus without network
+    """
+    pages = dict(corpus)
+
+    def fetch(url, timeout, user_agent='Mozilla/5.0', deadline=None):
+        return url, 200, pages[url], 0.0
+    return fetch
+
+
+def new_crawler(corpus, profile, output_directory, archive=None):
+    """
+    :param corpus: list of (url, html) of the pages
+    :param profile: the output profile name
+    :param output_directory: the directory the scraped pages are saved to
+    :param archive: the WARC file the corpus is read from, if any
+    :return: a fresh WebCrawling object, so no profile pays for the seen URLs of another one
+    """
+    if archive is not None:
+        crawler = WebCrawling(url=corpus[0][0], file_n=output_directory, label=None, label_details=None,
+                              max_crawling=10 ** 6, collection_source=None, crawl_time_out=7200,
+                              output_fields=profile, archive_file=archive, archive_mode='replay')
+    else:
+        crawler = WebCrawling(url=corpus[0][0], file_n=output_directory, label=None, label_details=None,
+                              max_crawling=10 ** 6, collection_source=None, crawl_time_out=7200,
+                              output_fields=profile)
+        crawler.fetch = offline_fetch(corpus)
+    # the pages are scraped as internal URLs, the redirect check of the target URL itself is not measured
+    crawler.first_url = False
+    return crawler
+
+
+def scrape_pages(crawler, corpus, pages):
+    """
+    :param crawler: the WebCrawling object the pages are scraped for
+    :param corpus: list of (url, html) of the pages
+    :param pages: the number of pages processed through the whole pipeline (fetch, parse, features, export, links)
+    :return: the throughput in pages per second
+    """
+    time_start = time.perf_counter()
+    for i in range(pages):
+        crawler.scrape_url(corpus[i % len(corpus)][0])
+        crawler.internal_urls = []
+    return pages / (time.perf_counter() - time_start)
+
+
+def run_profile(corpus, profile, pages, repeats=5, warmup=3, archive=None):
+    """
+    :param corpus: list of (url, html) of the pages
+    :param profile: the output profile name
+    :param pages: the number of pages processed in each repeat
+    :param repeats: the number of measured repeats, each with a fresh crawler
+    :param warmup: the number of pages processed before measuring
+    :param archive: the WARC file the corpus is read from, if any
+    :return: the median throughput of the repeats in pages per second
+    """
+    with tempfile.TemporaryDirectory() as output_directory:
+        output_directory = output_directory + '/'
+        if warmup:
+            scrape_pages(new_crawler(corpus, profile, output_directory, archive), corpus, warmup)
+        return statistics.median(scrape_pages(new_crawler(corpus, profile, output_directory, archive), corpus, pages)
+                                 for _ in range(repeats))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-profile scraping throughput')
+    # number of pages processed in each repeat of a profile
+    parser.add_argument('--pages', type=int, default=20)
+    # number of measured repeats of each profile, the median is reported
+    parser.add_argument('--repeats', type=int, default=5)
+    # number of pages processed before measuring each profile
+    parser.add_argument('--warmup', type=int, default=3)
+    # optional - a recorded WARC file used as corpus instead of the synthetic page
+    parser.add_argument('--archive', default=None)
+    # the geolocation lookup of the 'full' profile is read from the archive when replaying, and replaced by a
+    # fixed value for the synthetic page, so no profile measures the network
+    parser.add_argument('profiles', nargs='*', default=list(OUTPUT_PROFILES))
+    args = parser.parse_args()
+
+    if args.archive is not None:
+        corpus = archive_pages(args.archive)
+    else:
+        corpus = [('http://example.com/', synthetic_page())]
+        CrawlScrape.get_geo_loc = offline_geo_loc
+    for profile in args.profiles:
+        throughput = run_profile(corpus, profile, args.pages, args.repeats, args.warmup, args.archive)
+        print(profile + ": " + str(round(throughput, 2)) + " pages/s")
@@ -1,7 +1,10 @@
-from CrawlScrape import InitiateProject
+from CrawlScrape import InitiateProject, configure_logging
 
 
 if __name__ == '__main__':
+    # logging is configured by the caller, records are written to logfile.log and the console by a background thread
+    configure_logging(log_file='logfile.log')
+
     # list of all website need to be crawled
     dataset = ['www.um.edu.my', 'https://upm.edu.my']
 